@@ -1,4 +1,7 @@
 from .tree import TreeWorker, ChainWorker, TreeView, ChainView, Sample
+from .cache import EntryListCache, ResultCache, contentkey
+from .toolbox import TH1AddDirSentry
+from .executor import LoopExecutor
 from .base import Labelled
 from collections import OrderedDict
 import os.path
@@ -6,6 +9,8 @@ import ROOT
 import logging
 import copy
 import itertools
+import functools
+import threading
 import pdb
 
 
@@ -52,6 +57,84 @@ class Latino:
         return s
 
 
+#______________________________________________________________________________
+def _locked(method):
+    '''serializes the access to the chains of the analyser'''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+#______________________________________________________________________________
+class CutTrie(object):
+    '''
+    The views of the cut flows of a mother analyser and its clones, stored as
+    a trie of cuts: the views of a common prefix are made once and shared.
+    Each node counts the analysers using it, and is dropped together with
+    its view when none does.
+    '''
+
+    class Node(object):
+        __slots__ = ('cut','view','parent','children','refs')
+
+        def __init__(self, cut, view, parent):
+            self.cut      = cut
+            self.view     = view
+            self.parent   = parent
+            self.children = {}
+            self.refs     = 0
+
+        def __repr__(self):
+            return 'Node(%r,refs=%d,children=%d)' % (self.cut,self.refs,len(self.children))
+
+    # ---
+    def __init__(self):
+        # the root stands for the chain view
+        self.root = CutTrie.Node(None,None,None)
+
+    # ---
+    def __len__(self):
+        n,todo = 0,[self.root]
+        while todo:
+            node = todo.pop()
+            n += len(node.children)
+            todo.extend(node.children.itervalues())
+        return n
+
+    # ---
+    def find(self, cuts, node=None):
+        '''the nodes of the longest prefix of cuts already in the trie, starting from node'''
+        node  = node if node else self.root
+        nodes = []
+        for c in cuts:
+            node = node.children.get(str(c))
+            if node is None: break
+            nodes.append(node)
+        return nodes
+
+    # ---
+    def insert(self, cut, view, parent=None):
+        parent = parent if parent else self.root
+        node = CutTrie.Node(str(cut),view,parent)
+        parent.children[node.cut] = node
+        return node
+
+    # ---
+    def acquire(self, nodes):
+        for n in nodes:
+            n.refs += 1
+
+    # ---
+    def release(self, nodes):
+        for n in reversed(nodes):
+            n.refs -= 1
+            if n.refs > 0: continue
+            if n.parent.children.get(n.cut) is n: del n.parent.children[n.cut]
+            if n.view is not None: n.view.release()
+
+
 #______________________________________________________________________________
 class CutFlow(OrderedDict):
 
@@ -236,6 +319,27 @@ class AnalysisView(object):
 
 
 
+#______________________________________________________________________________
+class WeightSentry:
+    '''
+    Replaces temporarily the weight of the trees of a chain. A None weight
+    leaves them untouched.
+    '''
+    def __init__(self, chain, weight=None):
+        self.weights = [ (t,t.weight) for t in chain ]
+        if weight is None: return
+        for t in chain: t.weight = weight
+
+    def __del__(self):
+        for t,w in self.weights: t.weight = w
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.__del__()
+
+
 import types
 #______________________________________________________________________________
 #   ______               ___                __
@@ -246,36 +350,50 @@ import types
 #                                         /____/
 class TreeAnalyser(object):
     '''
-    TODO: Add the capability of adding analysis steps:
-        It can happen to have multiple selections chains with a partial selection overlap
-
-        the goal would be to be capable of:
+    Multiple selection chains can partially overlap:
 
         mother = TreeAnalyser(sample, cuts)
         mother.bufferentries()
 
         child1 = mother.clone()
-        child1['stepA'] = 'pt > 100'
+        child1.append('stepA','pt > 100')
         child2 = mother.clone()
-        child2['stepB'] = 'pt < 100'
+        child2.append('stepB','pt < 100')
+
+    The mother and its clones share the views of their steps through a
+    CutTrie: the steps in common are evaluated once, only the diverging
+    ones are made by each analyser.
     '''
     _log = logging.getLogger('TreeAnalyser')
 
     #---
-    def __init__(self, samples=None, cuts=None ):
+    def __init__(self, samples=None, cuts=None, lazy=False ):
         self._cuts      = cuts
         self._views     = None
+        # the trie nodes of the views, shared with the clones
+        self._trie      = CutTrie()
+        self._nodes     = []
         self._modified  = True
         self._worker    = None
         self._cview     = None
         self._aview     = None
         self._filters = []
-
-        self.__build(samples)
-
-    def __build(self, samples):
-        # build the
-        self._worker = ChainWorker.fromsamples(*samples) if samples else None
+        # memoization of plots and yields (ResultCache)
+        self.results    = None
+        # build the views from cut masks (see bufferentries)
+        self.masks      = False
+        # fill flows and regions in one python event loop rather than with
+        # one TTree::Draw per step (see EventLoop)
+        self.onepass    = False
+        # background execution (see plot_async)
+        self._lock      = threading.RLock()
+        self._executor  = None
+
+        self.__build(samples, lazy)
+
+    def __build(self, samples, lazy=False):
+        # build the workers, the chains are loaded on first use if lazy
+        self._worker = ChainWorker.fromsamples(*samples, lazy=lazy) if samples else None
         self._cview  = ChainView(self._worker)
 
         self._aview  = AnalysisView(self._cview, filters=self._filters)
@@ -294,13 +412,24 @@ class TreeAnalyser(object):
 
         other            = TreeAnalyser()
         other._cuts      = copy.deepcopy(self._cuts)
-        other._views     = copy.deepcopy(self._views)
+        # the views are shared through the trie
+        other._views     = OrderedDict(self._views) if self._views is not None else None
+        other._trie      = self._trie
+        other._nodes     = list(self._nodes)
+        other._trie.acquire(other._nodes)
         other._worker    = self._worker
         other._modified  = self._modified
+        other.masks      = self.masks
+        other.onepass    = self.onepass
         other._cview     = self._cview
         other._aview     = self._aview
 
         other._filters = copy.deepcopy(self._filters)
+        # the keys include the cuts: the cache can be shared
+        other.results  = self.results
+        # same chains, same lock
+        other._lock     = self._lock
+        other._executor = self._executor
 
         return other
 
@@ -326,6 +455,84 @@ class TreeAnalyser(object):
         self._lumi = lumi
         self._worker.scale = self._lumi
 
+    #---
+    @property
+    def entrycache(self):
+        return self._worker.entrycache
+
+    #---
+    @entrycache.setter
+    def entrycache(self,cache):
+        '''
+        Cache the entrylists on disk: an EntryListCache or the path to the cache
+        directory. Views already built are not affected.
+        '''
+        if isinstance(cache,str): cache = EntryListCache(cache)
+        self._worker.entrycache = cache
+
+    #---
+    @property
+    def iopolicy(self):
+        return self._worker.iopolicy
+
+    #---
+    @iopolicy.setter
+    def iopolicy(self,policy):
+        '''The read cache configuration of the chains (IOPolicy), None for the ROOT defaults'''
+        self._worker.iopolicy = policy
+
+    #---
+    @property
+    def compact(self):
+        return self._worker.compact
+
+    #---
+    @compact.setter
+    def compact(self,c):
+        '''
+        Store the entries of the views as sorted arrays of entry numbers,
+        converted to TEntryLists only when a Draw needs them. Views already
+        built are not affected.
+        '''
+        self._worker.compact = c
+
+    #---
+    @property
+    def processes(self):
+        return self._worker.processes
+
+    #---
+    @processes.setter
+    def processes(self,n):
+        '''Number of processes used to run the samples in parallel (0: sequential)'''
+        self._worker.processes = n
+        self._cview.processes  = n
+        for v in (self._views or {}).itervalues():
+            v.processes = n
+
+    #---
+    @property
+    def results(self):
+        return self._results
+
+    #---
+    @results.setter
+    def results(self,cache):
+        '''
+        Memoize plot and yields: a ResultCache, the path of a directory where
+        to store them or None to disable it
+        '''
+        if isinstance(cache,str): cache = ResultCache(path=cache)
+        self._results = cache
+
+    #---
+    @property
+    def executor(self):
+        '''The executor of the *_async methods, made on demand'''
+        if not self._executor:
+            self._executor = LoopExecutor(self._lock)
+        return self._executor
+
     #---
     @property
     def cuts(self):
@@ -351,20 +558,63 @@ class TreeAnalyser(object):
 
         return self._worker._cutexpr(cuts)
 
+    #---
+    def _resultkey(self, *args):
+        '''
+        Content key of a result: the samples (including weights and scales,
+        i.e. the lumi), the cumulative cut and the call arguments
+        '''
+        return contentkey(self._worker._fingerprint(), self._cuts.string() if self._cuts else '', *args)
+
+    #---
+    def _lastview(self):
+        '''the view of the full selection, the chain view if there are no cuts'''
+        views = self._ensureviews()
+        return views[views.keys()[-1]] if views else self._cview
+
+    #---
+    def _onepass(self, exprs):
+        '''True if the expressions are to be filled in one event loop'''
+        return self.onepass and not self._worker._arrayexprs([ str(e) for e in exprs if e ])
+
+    #---
+    def _flowbase(self):
+        '''
+        The view to fill a cut flow in one pass, the cuts still to be applied
+        to it and the number of steps it already passes: the view of the
+        first step, with the cumulative filling of the other ones. A deeper
+        view would miss the entries failing the later cuts, which the looser
+        steps count. The view of the first step is reused if made already
+        (by this analyser or by the ones sharing the trie), else made with
+        TTree::Draw: the loop never runs on the full chain.
+        '''
+        if self._views is None: self._views = OrderedDict()
+        if self._modified or self._changed():
+            self._purgeviews(self._cuts, self._views)
+        self._growviews(self._cuts, self._views, 1)
+
+        return self._views.values()[0],self._cuts.values()[1:],1
+
     #---
     def _deleteentries(self):
-        # does it delete the list?
+        # the views are deleted with the last analyser using them
+        self._trie.release(self._nodes)
+        self._nodes = []
         self._views = None
 
     # ---
     def _ensureviews(self, force=False):
-        if force: self._deleteentries()
+        if force:
+            self._deleteentries()
+            # don't reuse the views of the clones either
+            self._trie = CutTrie()
+            self._worker.clearcache()
 
         if not self._views:
             self._views = OrderedDict()
             self._modified = True
 
-        if self._modified:
+        if self._modified or self._changed():
             self._log.debug('modified cuts!')
             self._purgeviews(self._cuts, self._views)
             self._growviews(self._cuts, self._views)
@@ -372,61 +622,90 @@ class TreeAnalyser(object):
         return self._views
 
     # ---
-    def _growviews(self, cutflow, views ):
-        # does it need to depend on cutflow and views?
+    def _changed(self):
+        '''True if the cuts were edited in place since the views were made'''
+        cuts = self._cuts.items() if self._cuts else []
+        if len(cuts) != len(self._nodes): return True
+        return any([ n != m or str(c) != node.cut for (n,c),m,node in zip(cuts,self._views.iterkeys(),self._nodes) ])
+
+    # ---
+    def _growviews(self, cutflow, views, nsteps=None ):
+        '''
+        Appends the views of the steps of cutflow missing in views. The views
+        made by the analysers sharing the trie are all reused, new ones are
+        made up to step nsteps only, if given.
+        '''
         self._log.debug('growing viewlist')
         # explect cutflow to be longer than
+        items = cutflow.items()
 
         nv = len(views)
-        nc = len(cutflow)
+        nc = len(items)
         if nv == nc : return views
         elif nv > nc : raise ValueError('WTF!')
 
+        parent  = self._nodes[-1] if self._nodes else None
+
+        # reuse the views already made by the analysers sharing the trie
+        found = self._trie.find([ c for n,c in items[nv:] ], parent)
+        self._trie.acquire(found)
+        for (n,c),node in zip(items[nv:],found):
+            views[n] = node.view
+        self._nodes.extend(found)
+        if found: self._log.debug('reusing %d views', len(found))
+
+        nv += len(found)
+        nc  = nc if nsteps is None else max(min(nsteps,nc),nv)
+        newcuts = items[nv:nc]
+        if not newcuts: return views
+
         # last is the last valid view, used to grow the list
-        #last = views.values()[-1] if nv > 0 else ChainView(self._worker)
-        last = views.values()[-1] if nv > 0 else self._cview
+        last = self._nodes[-1].view if self._nodes else self._cview
 
-        newcuts = cutflow[nv:]
         self._log.debug('appending %s', newcuts)
-        for i,(n,c) in enumerate(newcuts.iteritems()):
-            m = last.spawn(c,'elist%d' % (i+nv) )
-            last = m
+        names = [ 'elist%d' % (i+nv) for i in xrange(len(newcuts)) ]
+        if self.masks:
+            # one read of the entries of the last valid view, for the new
+            # steps only
+            spawned = last.spawnflow([ c for n,c in newcuts ],names)
+        else:
+            spawned = []
+            for (n,c),name in zip(newcuts,names):
+                last = last.spawn(c,name)
+                spawned.append(last)
+
+        for (n,c),m in zip(newcuts,spawned):
+            node = self._trie.insert(c, m, self._nodes[-1] if self._nodes else None)
+            self._trie.acquire([node])
+            self._nodes.append(node)
             views[n] = m
 
         return views
 
     # ---
     def _purgeviews(self, cutflow, views ):
-        # does it need to depend on cutflow and views?
-
+        '''
+        Keeps the views of the longest unchanged prefix of the cut flow. The
+        views are matched on the content of the cuts (kept by their trie
+        nodes): renaming a step only relabels its view.
+        '''
         self._log.debug('purging viewlist')
-        # check the keys
-        nv = len(views)
-
 
-        if len(cutflow) == 0:
-            # the new list is empty! what do we do?
-            numok = 0
-        else:
-            k = 0
-            matches = False
-            # find the first mismatching cut
-            for k, ( n,m ) in enumerate(itertools.izip(cutflow.iterkeys(),views.iterkeys())):
-                matches =  ( n == m ) and ( str(cutflow[n]) == str(views[m].cut) )
-                if not matches: break
-            if k==0 and not matches:
-                # disagreement at the first match
-                numok = 0
-            elif not matches:
-                numok = k
-            else:
-                numok = k+1
+        numok = 0
+        for c,node in itertools.izip(cutflow.itervalues(),self._nodes):
+            if str(c) != node.cut: break
+            numok += 1
 
         # purge the rest of elists
-        if numok < nv:
-            for n in views.keys()[numok:nv]:
-                self._log.debug('Deleting %s',n)
-                del views[n]
+        if numok < len(self._nodes):
+            self._log.debug('Deleting %s',views.keys()[numok:])
+            self._trie.release(self._nodes[numok:])
+            del self._nodes[numok:]
+
+        # relabel the views left
+        views.clear()
+        for n,node in itertools.izip(cutflow.iterkeys(),self._nodes):
+            views[n] = node.view
 
         if self._log.isEnabledFor(logging.DEBUG):
             self._log.debug('views left')
@@ -437,8 +716,19 @@ class TreeAnalyser(object):
 
 
     #---
-    def bufferentries(self, force=False):
-        '''buffer the entries'''
+    @_locked
+    def bufferentries(self, force=False, masks=None):
+        '''
+        buffer the entries
+
+        masks: if True, the selections of all the steps are evaluated in a
+        single pass on the data and stored as bitmasks. entriesflow and
+        yieldsflow are then computed from the masks, while the entrylists
+        are made only when a plot needs them.
+        '''
+        if masks is not None and masks != self.masks:
+            self.masks = masks
+            force = True
         self._ensureviews( force )
 
     #---
@@ -468,10 +758,12 @@ class TreeAnalyser(object):
         self._modified = True
 
     #---
+    @_locked
     def entries(self,cut=None):
         return self._worker.entries(cut)
 
     #---
+    @_locked
     def selectedentries(self,cut=None):
         views = self._ensureviews()
 
@@ -482,6 +774,7 @@ class TreeAnalyser(object):
             return views[views.keys()[-1]].entries(cut)
 
     #---
+    @_locked
     def entriesflow(self,cut=None):
         '''TODO: use the entrylist'''
 
@@ -489,38 +782,67 @@ class TreeAnalyser(object):
         return OrderedDict([ (n, v.entries(cut)) for n,v in self._views.iteritems()])
 
     #---
+    @_locked
     def yields(self, extra=None):
+        key = self._resultkey('yields', extra) if self.results is not None else None
+        if key:
+            y = self.results.get(key)
+            if y is not None: return copy.copy(y)
+
         # make the entries
         views = self._ensureviews()
 
         # using elist[:] doesn't clone the TEntryList, but inserts the reference only.
         if not views:
-            return self._worker.yields(extra)
+            y = self._worker.yields(extra)
         else:
-            return views[views.keys()[-1]].yields(extra)
+            y = views[views.keys()[-1]].yields(extra)
+
+        if key: self.results.put(key,copy.copy(y))
+        return y
 
     #---
+    @_locked
     def yieldsflow(self, extra=None):
-        # make the entries
-        views = self._ensureviews()
+        if not self._cuts: return OrderedDict()
+
+        if self.masks or not self._onepass(self._cuts.values()+[extra]):
+            # the yields are computed from the masks or the entrylists
+            views = self._ensureviews()
+            return OrderedDict([( n,v.yields(extra) ) for n,v in views.iteritems()])
 
-        if not views: return OrderedDict()
+        # one pass, cumulative filling
+        base,cuts,offset = self._flowbase()
+        base.bookyieldsflow('yieldsflow', cuts, extra, offset)
+        yields = base.run()['yieldsflow']
 
-        return OrderedDict([( n,v.yields(extra) ) for n,v in views.iteritems()])
+        return OrderedDict(zip(self._cuts.keys(),yields))
 
     #---
+    @_locked
     def plot(self, name, varexp, options='', bins=None, extra=None, postprocess=None):
-        # make the entries
-        views = self._ensureviews()
+        key = self._resultkey('plot', varexp, options, bins, extra) if self.results is not None else None
+        p = self._rawplot(name, varexp, options, bins, extra, key)
 
-        if not views:
-            # here I might want to use a view anyway
-            #v = ChainView(self._worker)
-            v = self._cview
-        else:
-            v = views[views.keys()[-1]]
+        return self._finishplot(p, name, key, postprocess)
+
+    #---
+    def _rawplot(self, name, varexp, options, bins, extra, key=None):
+        '''the plot before the filters, from the cache if there'''
+        p = self.results.get(key) if key else None
 
-        p = v.plot(name,varexp,extra,options,bins)
+        if p is None:
+            p = self._lastview().plot(name,varexp,extra,options,bins)
+            if key: self.results.put(key,p)
+
+        return p
+
+    #---
+    def _finishplot(self, p, name, key=None, postprocess=None):
+        if key:
+            # the cached histogram must not be touched by the filters
+            dirsentry = TH1AddDirSentry()
+            p = p.Clone(name)
 
         # make a list with all processors
         procs = self._filters if not postprocess else (self._filters+[postprocess])
@@ -531,18 +853,96 @@ class TreeAnalyser(object):
         return p
 
     #---
+    def plot_async(self, name, varexp, options='', bins=None, extra=None, postprocess=None):
+        '''
+        Queues plot on the executor and returns a Future right away. The
+        plots are filled on the thread of the executor, those queued together
+        and sharing the same view in one event loop; the filters are applied
+        by result(), on the calling thread. Requests run with the cuts and
+        samples in place when they are processed, not when they are
+        submitted.
+        '''
+        if options or not TreeWorker._fixedbins(bins):
+            # not supported by the booking API: plot on its own
+            state = {}
+            def draw():
+                state['key'] = self._resultkey('plot', varexp, options, bins, extra) if self.results is not None else None
+                return self._rawplot(name, varexp, options, bins, extra, state['key'])
+
+            return self.executor.submit(None, draw, lambda p: self._finishplot(p, name, state['key'], postprocess))
+
+        state = {}
+        def view():
+            key = self._resultkey('plot', varexp, options, bins, extra) if self.results is not None else None
+            state['key'] = key
+            state['hist'] = self.results.get(key) if key else None
+            return self._lastview() if state['hist'] is None else None
+
+        def book(v, n):
+            v.book(n, varexp, bins, extra)
+
+        def finish(p):
+            key = state['key']
+            if p is None:
+                p = state['hist']
+            else:
+                p.SetName(name)
+                if key: self.results.put(key,p)
+            return self._finishplot(p, name, key, postprocess)
+
+        return self.executor.submit(view, book, finish)
+
+    #---
+    def yields_async(self, extra=None):
+        '''Queues yields on the executor and returns a Future (see plot_async)'''
+        state = {}
+        def view():
+            key = self._resultkey('yields', extra) if self.results is not None else None
+            state['key'] = key
+            state['yields'] = self.results.get(key) if key else None
+            return self._lastview() if state['yields'] is None else None
+
+        def book(v, n):
+            v.bookyields(n, extra)
+
+        def finish(y):
+            key = state['key']
+            if y is None: return copy.copy(state['yields'])
+            if key: self.results.put(key,copy.copy(y))
+            return y
+
+        return self.executor.submit(view, book, finish)
+
+    #---
+    def wait(self):
+        '''blocks until all the queued requests are processed'''
+        if self._executor: self._executor.wait()
+
+    #---
+    @_locked
     def plotsflow(self, name, varexp, options='', bins=None, extra=None, postprocess=None):
         '''
         Create a flow of plots
         Always call View.plot
         '''
-        # make the entries
-        views = self._ensureviews()
+        if not self._cuts: return OrderedDict()
+
+        # the single pass needs a fixed binning
+        if options or self.masks or not TreeWorker._fixedbins(bins) or not self._onepass(self._cuts.values()+[extra]):
+            # make the entries
+            views = self._ensureviews()
 
-        # add the weight and get the yields
-        if not views: return OrderedDict()
+            plots = OrderedDict([( n,v.plot('%s_%s' % (name,n),varexp,extra,options,bins) ) for n,v in views.iteritems()])
+        else:
+            # one pass, cumulative filling
+            base,cuts,offset = self._flowbase()
+            base.bookflow(name, varexp, bins, cuts, extra, offset)
+            hists = base.run()[name]
 
-        plots =  OrderedDict([( n,v.plot('%s_%s' % (name,n),varexp,extra,options,bins) ) for n,v in views.iteritems()])
+            plots = OrderedDict()
+            for n,h in zip(self._cuts.keys(),hists):
+                h.SetName('%s_%s' % (name,n))
+                plots[n] = h
 
         # make a list with all processors
         procs = self._filters if not postprocess else (self._filters+[postprocess])
@@ -553,23 +953,213 @@ class TreeAnalyser(object):
 
         return plots
 
-    # ---
-    def splityields(self, regions, extra=None):
+    #---
+    @_locked
+    def snapshot(self, directory, branches=None):
+        '''
+        Writes the entries passing all the cuts to one rootfile per sample
+        in directory and returns the list of Samples pointing at them, with
+        the weights and scales (see TreeWorker.snapshot)
+        '''
+        # the lumi is applied again by the analysers of the samples
+        return self._lastview().snapshot(directory, branches, self._worker.scale)
 
-        plots  = OrderedDict()
+    # ---
+    @staticmethod
+    def _splitcuts(regions, extra=None, category=None):
+        '''the equivalent cut of each region'''
+        cuts = OrderedDict()
         for rname,rcut in regions.iteritems():
-            cut = rcut if not extra else '(%s) && (%s)' % (rname,extra)
-            plots[rname] = self.yields(cut)
+            if category: rcut = '(%s) == %s' % (category,rcut)
+            cuts[rname] = rcut if not extra else '(%s) && (%s)' % (rcut,extra)
+        return cuts
+
+    # ---
+    @_locked
+    def splityields(self, regions, extra=None, category=None):
+        '''
+        Yields in each region, computed in a single pass if onepass is set
+        (one TTree::Draw per region otherwise). regions maps names to cuts
+        or, if category is given, to values of the category expression
+        (mutually exclusive regions)
+        '''
+        cuts = self._splitcuts(regions, extra, category)
+        if not cuts: return OrderedDict()
+
+        keys = [ self._resultkey('yields', c) for c in cuts.itervalues() ] if self.results is not None else []
+        cached = [ self.results.get(k) for k in keys ]
+        if keys and None not in cached:
+            return OrderedDict(zip(cuts.keys(),[ copy.copy(y) for y in cached ]))
+
+        if not self._onepass(cuts.values()):
+            return OrderedDict([ (rname,self.yields(cut)) for rname,cut in cuts.iteritems() ])
+
+        view = self._lastview()
+        view.bookyieldsregions('splityields', regions.values(), extra, category)
+        yields = view.run()['splityields']
+
+        for k,y in zip(keys,yields): self.results.put(k,copy.copy(y))
+
+        return OrderedDict(zip(cuts.keys(),yields))
+
+    # ---
+    @_locked
+    def splitplot(self, name, varexp, regions, options='',bins=None, extra=None, postprocess=None, category=None):
+        '''
+        Plots in each region, filled in a single pass (see splityields).
+        Draw options, automatic binning and array-like cuts fall back to one
+        plot per region.
+        '''
+        cuts = self._splitcuts(regions, extra, category)
+        if not cuts: return OrderedDict()
+
+        if options or not TreeWorker._fixedbins(bins) or not self._onepass(cuts.values()):
+            return OrderedDict([ (rname,self.plot(name,varexp,options,bins,cut,postprocess)) for rname,cut in cuts.iteritems() ])
+
+        keys = [ self._resultkey('plot', varexp, options, bins, c) for c in cuts.itervalues() ] if self.results is not None else []
+        hists = [ self.results.get(k) for k in keys ]
+
+        if not keys or None in hists:
+            view = self._lastview()
+            view.bookregions(name, varexp, bins, regions.values(), extra, category)
+            hists = view.run()[name]
+
+            for k,h in zip(keys,hists): self.results.put(k,h)
+
+        # make a list with all processors
+        procs = self._filters if not postprocess else (self._filters+[postprocess])
+
+        plots = OrderedDict()
+        for rname,h in zip(cuts.iterkeys(),hists):
+            if keys:
+                # the cached histogram must not be touched by the filters
+                dirsentry = TH1AddDirSentry()
+                h = h.Clone(name)
+            h.SetName(name)
+
+            for proc in procs: proc(h)
+            plots[rname] = h
 
         return plots
 
     # ---
-    def splitplot(self, name, varexp, regions, options='',bins=None, extra=None, postprocess=None):
+    def _variations(self, variations, extra=None):
+        '''
+        Resolves the variations into (weight, cut) pairs, the nominal first.
+        A variation is an alternative weight (replacing the sample weight) or
+        a (weight, overrides) pair, overrides being a dictionary of cuts
+        replacing the steps of the cutflow with the same name. A None weight
+        stands for the nominal one.
+
+        The variations are grouped by the first step they override. Each
+        group runs on the view of the step before it, with the cuts from
+        that step on: only the changed part of the selection is evaluated
+        again. Returns the variation names and the list of (view, pairs)
+        groups to run.
+        '''
+        if 'nominal' in variations:
+            raise ValueError('\'nominal\' is a reserved variation name')
+
+        cutflow = self._cuts or OrderedDict()
+        steps   = cutflow.keys()
+
+        specs = OrderedDict([('nominal',(None,None))])
+        for n,v in variations.iteritems():
+            w,overrides = v if isinstance(v,tuple) else (v,None)
+            for k in (overrides or {}):
+                if k not in cutflow:
+                    raise KeyError('Variation %s overrides the unknown cut %s' % (n,k))
+            specs[n] = (w,overrides)
+
+        # first overridden step of each variation, all the steps passed if none
+        firsts = OrderedDict()
+        for n,(w,overrides) in specs.iteritems():
+            changed = [ steps.index(k) for k,c in (overrides or {}).iteritems() if str(c) != str(cutflow[k]) ]
+            firsts.setdefault(min(changed) if changed else len(steps),[]).append(n)
+
+        views  = self._ensureviews().values() if steps else []
+        groups = []
+        for i,names in sorted(firsts.iteritems()):
+            pairs = OrderedDict()
+            for n in names:
+                w,overrides = specs[n]
+                cuts = [ str((overrides or {}).get(k,c)) for k,c in cutflow.items()[i:] ]
+                pairs[n] = (w, cuts+([extra] if extra else []))
+            groups.append( (views[i-1] if i else self._cview, pairs) )
+
+        return specs.keys(),groups
+
+    # ---
+    def _variationsonepass(self, groups):
+        '''True if the variation groups are to be filled in one event loop'''
+        return self._onepass([ e for v,pairs in groups for w,cuts in pairs.itervalues() for e in [w]+cuts ])
 
-        plots  = OrderedDict()
-        for rname,rcut in regions.iteritems():
-            cut = rcut if not extra else '(%s) && (%s)' % (rname,extra)
-            plots[rname] = self.plot(name,varexp,options,bins,cut,postprocess)
+    # ---
+    @_locked
+    def yieldsvariations(self, variations, extra=None):
+        '''
+        Nominal and varied yields, computed in a single pass if onepass is
+        set (see _variations), else with one TTree::Draw per variation
+        '''
+        names,groups = self._variations(variations, extra)
+
+        yields = {}
+        if not self._variationsonepass(groups):
+            for view,pairs in groups:
+                for n,(w,cuts) in pairs.iteritems():
+                    with WeightSentry(self._worker, w):
+                        yields[n] = view.yields(' && '.join([ '(%s)' % c for c in cuts ]))
+
+            return OrderedDict([ (n,yields[n]) for n in names ])
+
+        for view,pairs in groups:
+            view.bookyieldsvariations('yieldsvariations', pairs.values())
+            yields.update(zip(pairs.keys(),view.run()['yieldsvariations']))
+
+        return OrderedDict([ (n,yields[n]) for n in names ])
+
+    # ---
+    @_locked
+    def plotvariations(self, name, varexp, variations, bins=None, extra=None, postprocess=None):
+        '''
+        Nominal and varied histograms, filled in a single pass if onepass is
+        set (see _variations), else with one TTree::Draw per variation. The
+        single pass needs the binning to be fully specified.
+        '''
+        key = self._resultkey('plotvariations', varexp, bins, extra, sorted(variations.iteritems())) if self.results is not None else None
+        hists = self.results.get(key) if key else None
+
+        if hists is None:
+            names,groups = self._variations(variations, extra)
+
+            filled = {}
+            if not TreeWorker._fixedbins(bins) or not self._variationsonepass(groups):
+                for view,pairs in groups:
+                    for n,(w,cuts) in pairs.iteritems():
+                        with WeightSentry(self._worker, w):
+                            filled[n] = view.plot('%s_%s' % (name,n), varexp, ' && '.join([ '(%s)' % c for c in cuts ]), bins=bins)
+            else:
+                for view,pairs in groups:
+                    view.bookvariations(name, varexp, bins, pairs.values())
+                    filled.update(zip(pairs.keys(),view.run()[name]))
+
+            hists = OrderedDict([ (n,filled[n]) for n in names ])
+            for n,h in hists.iteritems(): h.SetName('%s_%s' % (name,n))
+
+            if key: self.results.put(key,hists)
+
+        # make a list with all processors
+        procs = self._filters if not postprocess else (self._filters+[postprocess])
+
+        plots = OrderedDict()
+        for n,h in hists.iteritems():
+            if key:
+                # the cached histogram must not be touched by the filters
+                dirsentry = TH1AddDirSentry()
+                h = h.Clone(h.GetName())
+
+            for proc in procs: proc(h)
+            plots[n] = h
 
         return plots
 
@@ -0,0 +1,200 @@
+import ROOT
+import os
+import hashlib
+import logging
+import uuid
+import cPickle
+import collections
+
+# _____________________________________________________________________________
+#    ______           __
+#   / ____/___ ______/ /_  ___
+#  / /   / __ `/ ___/ __ \/ _ \
+# / /___/ /_/ / /__/ / / /  __/
+# \____/\__,_/\___/_/ /_/\___/
+#
+
+
+# ---
+def filestamp(path):
+    '''size and modification time of a file, the zip member is ignored'''
+    filepath = path if '#' not in path else path[:path.index('#')]
+    st = os.stat(filepath)
+    return '%s:%d:%d' % (path, st.st_size, int(st.st_mtime))
+
+
+# ---
+def contentkey(*items):
+    '''sha1 digest of the string representation of items'''
+    h = hashlib.sha1()
+    for i in items:
+        h.update(repr(i))
+        h.update('\0')
+    return h.hexdigest()
+
+
+# ---
+class EntryListCache(object):
+    '''
+    Content-addressed on-disk store of TEntryLists.
+
+    Each list is stored in its own rootfile, named after a key built out of
+    the list of files (with sizes and modification times), the worker
+    selection, weight and aliases and the cumulative cut. Touching or
+    replacing any input file changes the key, so stale lists are never
+    picked up.
+    '''
+    _log = logging.getLogger('EntryListCache')
+
+    # ---
+    def __init__(self, path):
+        self._path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    # ---
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__,self._path)
+
+    # ---
+    @property
+    def path(self):
+        return self._path
+
+    # ---
+    def key(self, tree, stamps, selection, weight, aliases, cut):
+        '''stamps: list of file stamps, as produced by filestamp'''
+        return contentkey(tree, stamps, str(selection), str(weight), sorted(aliases.iteritems()), str(cut))
+
+    # ---
+    def _filename(self, key):
+        return os.path.join(self._path, 'elist_%s.root' % key)
+
+    # ---
+    def get(self, key):
+        '''returns the cached list or None'''
+        filename = self._filename(key)
+        if not os.path.exists(filename): return None
+
+        f = ROOT.TFile.Open(filename)
+        if not f or f.IsZombie():
+            self._log.warning('Corrupted cache file %s', filename)
+            return None
+
+        elist = f.Get('elist')
+        if elist.__nonzero__():
+            # detach the list
+            elist.SetDirectory(0x0)
+            # ensure the ownership
+            ROOT.SetOwnership(elist,True)
+        else:
+            elist = None
+        f.Close()
+
+        self._log.debug('loaded %s', filename)
+        return elist
+
+    # ---
+    def put(self, key, elist):
+        filename = self._filename(key)
+        # write to a temporary file first, then move it in place
+        tmpname  = '%s.%s' % (filename,uuid.uuid1())
+
+        here = ROOT.gDirectory.func()
+        f = ROOT.TFile.Open(tmpname,'recreate')
+        f.WriteTObject(elist,'elist')
+        f.Close()
+        here.cd()
+
+        os.rename(tmpname,filename)
+        self._log.debug('stored %s', filename)
+
+    # ---
+    def clear(self):
+        for n in os.listdir(self._path):
+            if n.startswith('elist_'):
+                os.remove(os.path.join(self._path,n))
+
+
+# ---
+class ResultCache(object):
+    '''
+    Memoization store for plots and yields.
+
+    The most recently used results are kept in memory, up to maxsize. If a
+    path is given, results are also pickled to that directory and reloaded
+    from there by later sessions. Keys are expected to be content keys (see
+    contentkey): a change of any input produces a new key, therefore stale
+    entries are never returned, only evicted.
+    '''
+    _log = logging.getLogger('ResultCache')
+
+    # ---
+    def __init__(self, maxsize=128, path=None):
+        self._maxsize = maxsize
+        self._path    = path
+        self._store   = collections.OrderedDict()
+
+        if path and not os.path.exists(path):
+            os.makedirs(path)
+
+    # ---
+    def __repr__(self):
+        return '%s(%d/%d,%r)' % (self.__class__.__name__,len(self._store),self._maxsize,self._path)
+
+    # ---
+    def __len__(self):
+        return len(self._store)
+
+    # ---
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    # ---
+    def _filename(self, key):
+        return os.path.join(self._path, 'result_%s.pkl' % key)
+
+    # ---
+    def _remember(self, key, value):
+        self._store[key] = value
+        while len(self._store) > self._maxsize:
+            self._store.popitem(last=False)
+
+    # ---
+    def get(self, key):
+        '''returns the cached result or None'''
+        if key in self._store:
+            # move it to the top of the stack
+            value = self._store.pop(key)
+            self._store[key] = value
+            return value
+
+        if not self._path: return None
+
+        filename = self._filename(key)
+        if not os.path.exists(filename): return None
+
+        with open(filename,'rb') as f:
+            value = cPickle.load(f)
+
+        self._log.debug('loaded %s', filename)
+        self._remember(key,value)
+        return value
+
+    # ---
+    def put(self, key, value):
+        self._remember(key,value)
+
+        if not self._path: return
+
+        filename = self._filename(key)
+        # write to a temporary file first, then move it in place
+        tmpname  = '%s.%s' % (filename,uuid.uuid1())
+        with open(tmpname,'wb') as f:
+            cPickle.dump(value,f,cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmpname,filename)
+
+    # ---
+    def clear(self):
+        '''drops the results held in memory. The on-disk store is left untouched'''
+        self._store.clear()
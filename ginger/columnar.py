@@ -0,0 +1,352 @@
+import ROOT
+import re
+import math
+import logging
+import numpy
+from .core import Yield
+from . import odict
+from .event import Leaves
+from .loop import splitvarexp, Range
+from .formula import compileexpr
+
+# _____________________________________________________________________________
+#    ______      __
+#   / ____/___  / /_  ______ ___  ____  ____ ______
+#  / /   / __ \/ / / / / __ `__ \/ __ \/ __ `/ ___/
+# / /___/ /_/ / / /_/ / / / / / / / / / /_/ / /
+# \____/\____/_/\__,_/_/ /_/ /_/_/ /_/\__,_/_/
+#
+
+# flat numeric branches only: 'name/F'
+_scalarleaf = re.compile(r'^[a-zA-Z0-9_]+/([%s])$' % ''.join(Leaves.flag2dtype))
+# fixed size arrays: 'name[4]/F'
+_arrayleaf  = re.compile(r'^[a-zA-Z0-9_]+(\[\d+\])+/([%s])$' % ''.join(Leaves.flag2dtype))
+
+
+# ---
+def _tonumpy(buf, n):
+    '''copies a double* returned by TTree::GetVal(i) into a numpy array'''
+    if n == 0: return numpy.zeros(0)
+    buf.SetSize(n)
+    return numpy.array(numpy.frombuffer(buf, dtype=numpy.float64, count=n))
+
+
+# ---
+class ColumnReader(object):
+    '''
+    Reads scalar branches of a chain (and of its friends) into numpy arrays,
+    in bulk: all the columns are read by a single TTree::Draw, the loop over
+    the entries running in C++. Only the entries in the active entrylist are
+    read.
+    '''
+    _log = logging.getLogger('ColumnReader')
+
+    # ---
+    def __init__(self, chain):
+        self._chain = chain
+
+    # ---
+    def isscalar(self, column):
+        '''scalar branches or elements of fixed size arrays (jetpt[0])'''
+        if column == 'Entry$': return True
+
+        name = column.split('[')[0]
+        b = self._chain.GetBranch(name)
+        if not b.__nonzero__(): return False
+        leaf = _scalarleaf if name == column else _arrayleaf
+        return leaf.match(b.GetTitle()) is not None
+
+    # ---
+    def read(self, branches):
+        '''
+        Returns a dictionary of numpy arrays, one per column (branch or
+        indexed branch), plus the global entry numbers under 'Entry$'
+        '''
+        for b in branches:
+            if not self.isscalar(b):
+                raise ValueError('Branch \'%s\' is not a flat, scalar, branch' % b)
+
+        el = self._chain.GetEntryList()
+        total = el.GetN() if el.__nonzero__() else self._chain.GetEntries()
+
+        columns  = ['Entry$']+sorted(set(branches)-set(['Entry$']))
+        arrays   = {}
+        estimate = self._chain.GetEstimate()
+        self._chain.SetEstimate(total+1)
+
+        try:
+            # more than 4 columns need the para option, goff keeps them all
+            options = 'goff para' if len(columns) > 4 else 'goff'
+            n = self._chain.Draw(':'.join(columns),'',options)
+            if n != total:
+                raise RuntimeError('Expected %d rows, found %d' % (total,n))
+
+            for i,c in enumerate(columns):
+                arrays[c] = _tonumpy(self._chain.GetVal(i), n)
+        finally:
+            self._chain.SetEstimate(estimate)
+
+        self._log.debug('read %d entries of %s', total, columns)
+        return arrays
+
+
+# ---
+class CutMasks(object):
+    '''
+    The selections of the steps of a cut flow, stored as packed bitmasks over
+    the entries of the base selection (one bit per entry and step).
+
+    entries: global entry numbers of the base selection
+    weights: per-entry value of the worker weight
+    weight:  the weight expression the weights were computed with
+    '''
+
+    # ---
+    def __init__(self, entries, weight, weights, masks):
+        self.entries = entries
+        self.weight  = weight
+        self.weights = weights
+        self._bits   = [ numpy.packbits(m) for m in masks ]
+        self._sets   = None
+
+    # ---
+    def __len__(self):
+        return len(self._bits)
+
+    # ---
+    def mask(self, step):
+        return numpy.unpackbits(self._bits[step])[:len(self.entries)].astype(bool)
+
+    # ---
+    def entrynumbers(self, step):
+        return self.entries[self.mask(step)]
+
+    # ---
+    def entryset(self, step):
+        '''the EntrySet of step, made once and shared by all the views of the step'''
+        if self._sets is None: self._sets = [None]*len(self._bits)
+        if self._sets[step] is None:
+            self._sets[step] = EntrySet(self.entrynumbers(step))
+        return self._sets[step]
+
+    # ---
+    def count(self, step):
+        return int(numpy.count_nonzero(self.mask(step)))
+
+    # ---
+    def yields(self, step, scale=1.):
+        w = self.weights[self.mask(step)]
+        return Yield.fromsums(w.sum()*scale, (w*w).sum()*scale*scale, len(w))
+
+
+# ---
+class EntrySet(object):
+    '''
+    A selection stored as a sorted array of global entry numbers, 4 bytes per
+    entry when they fit.
+
+    The array is read-only: views copied from each other share the set as
+    it is. The TEntryList needed by TTree::Draw is made when needed and
+    released by the view sentry when the Draw is done (see TreeView._sentry).
+    '''
+
+    # ---
+    def __init__(self, entries):
+        entries = numpy.asarray(entries)
+        dtype = numpy.uint32 if not len(entries) or entries.max() < 2**32 else numpy.int64
+        self._entries = numpy.array(entries, dtype=dtype)
+        self._entries.flags.writeable = False
+        self._elist   = None
+
+    # ---
+    def __repr__(self):
+        return '%s(%d entries,%d bytes)' % (self.__class__.__name__,len(self),self.nbytes)
+
+    # ---
+    def __len__(self):
+        return len(self._entries)
+
+    # ---
+    def __iter__(self):
+        return iter(self._entries)
+
+    # ---
+    @property
+    def entries(self):
+        return self._entries
+
+    # ---
+    @property
+    def nbytes(self):
+        return self._entries.nbytes
+
+    # ---
+    def entrylist(self, worker, name):
+        '''the TEntryList of the entries of worker's chain'''
+        if self._elist is None:
+            self._elist = worker._entrylistfrom(name, self._entries)
+        return self._elist
+
+    # ---
+    def release(self):
+        '''drops the TEntryList, made again when needed'''
+        self._elist = None
+
+
+# ---
+class ColumnarEngine(object):
+    '''
+    Alternative execution engine for TreeWorker: the branches used by
+    varexp, cut and weight are read in bulk and the selection evaluated on
+    numpy arrays. Histograms are filled with numpy.histogram(dd).
+
+    The expressions are translated by formula.compileexpr, with the worker
+    aliases expanded.
+
+    maxcached: number of per-cut selections kept for the last base (see
+    cutmasks), the oldest are dropped first
+    '''
+    _log = logging.getLogger('ColumnarEngine')
+
+    # ---
+    def __init__(self, worker, maxcached=32):
+        self._worker = worker
+        self._reader = ColumnReader(worker._chain)
+        # per-cut selections on the last base (see cutmasks)
+        self._cutcache = None
+        self.maxcached = maxcached
+
+    # ---
+    def clearcache(self):
+        '''drops the per-cut selections kept by cutmasks'''
+        self._cutcache = None
+
+    # ---
+    def _evaluate(self, exprs):
+        aliases = self._worker.aliases()
+        formulas = [compileexpr(e,aliases) for e in exprs]
+        # pruning and read cache held for the read only, the formulas are
+        # evaluated on the arrays
+        iosentries = self._worker._ioguard(exprs)
+        try:
+            columns = self._reader.read( set().union(*[f.columns for f in formulas]) )
+        finally:
+            for s in reversed(iosentries): s.__del__()
+        return [f(columns) for f in formulas]
+
+    # ---
+    def cutmasks(self, cuts, base=None):
+        '''
+        Evaluates the cumulative selection of each cut in a single read of the
+        entries in the active entrylist (one TTree::Draw, see ColumnReader)
+
+        base: key of the active entrylist (e.g. the cut of the view). The
+        selection of each cut on the base is then kept, and only the cuts not
+        evaluated yet are read on the next call with the same base. Only the
+        last base is kept, with maxcached cuts at most.
+        '''
+        weight = self._worker.weight
+        cuts = [str(c) for c in cuts]
+        key = (self._worker._fingerprint(), base) if base is not None else None
+
+        cache = self._cutcache if self._cutcache and self._cutcache[0] == key else None
+        if cache:
+            entries, w, selected = cache[1:]
+            missing = sorted(set(cuts)-set(selected))
+            values = self._evaluate(missing) if missing else []
+        else:
+            missing = sorted(set(cuts))
+            values = self._evaluate([weight if weight else '1','Entry$']+missing)
+            w = values.pop(0).astype(numpy.float64)
+            entries = values.pop(0).astype(numpy.int64)
+            selected = odict.OrderedDict()
+
+        for c,v in zip(missing,values):
+            selected[c] = numpy.packbits(v != 0)
+        self._log.debug('%d cuts read, %d cached', len(missing), len(set(cuts))-len(missing))
+
+        # as TTree::Draw('>>elist'), entries with null weight are dropped
+        masks = []
+        last = (w != 0)
+        for c in cuts:
+            last = numpy.logical_and(last, numpy.unpackbits(selected[c])[:len(entries)].astype(bool))
+            masks.append(last)
+
+        # keep the last base only, and its most recent cuts
+        if key is not None and self.maxcached > 0:
+            for c in cuts:
+                selected[c] = selected.pop(c)
+            while len(selected) > self.maxcached:
+                del selected[selected.keys()[0]]
+            self._cutcache = (key, entries, w, selected)
+        else:
+            self._cutcache = None
+
+        return CutMasks(entries, weight, w, masks)
+
+    # ---
+    def entries(self, cut):
+        sel, = self._evaluate([cut])
+        return int(numpy.count_nonzero(sel))
+
+    # ---
+    def yields(self, cut=''):
+        cutexpr = self._worker._cutexpr(cut)
+        w, = self._evaluate([cutexpr if cutexpr else '1'])
+        w = w.astype(numpy.float64)
+
+        w = w[w != 0.]
+        scale = self._worker.scale
+        return Yield.fromsums(w.sum()*scale, (w*w).sum()*scale*scale, len(w))
+
+    # ---
+    def scan(self, exprs, cut='', keep=False):
+        values = self._evaluate(list(exprs)+[cut if cut else '1'])
+        sel = (values.pop() != 0)
+
+        ranges = odict.OrderedDict()
+        for e,v in zip(exprs,values):
+            v = v[sel].astype(numpy.float64)
+            r = Range(keep)
+            if len(v):
+                r.min,r.max,r.n = float(v.min()),float(v.max()),len(v)
+                if keep: r.values.fromlist(v.tolist())
+            ranges[e] = r
+        return ranges
+
+    # ---
+    def plot(self, name, varexp, cut='', bins=None):
+        ndim,hstr,h = self._worker._projexpr(name,bins)
+        if not h:
+            raise ValueError('Automatic binning not supported by the columnar engine (yet)')
+
+        h.SetDirectory(0x0)
+        h.SetXTitle(varexp)
+
+        cutexpr = self._worker._cutexpr(cut)
+        values = self._evaluate(splitvarexp(varexp)+[cutexpr if cutexpr else '1'])
+        w = values.pop().astype(numpy.float64)
+        if len(values) != ndim:
+            raise ValueError('Dimension mismatch between \'%s\' and %s (%dD)' % (varexp, name, ndim))
+
+        sel = (w != 0.)
+        w = w[sel]
+        values = [v[sel] for v in values]
+
+        # add under and overflow bins
+        axes  = [h.GetXaxis(),h.GetYaxis()][:ndim]
+        edges = [ [-numpy.inf]+[ax.GetBinLowEdge(i) for i in xrange(1,ax.GetNbins()+2)]+[numpy.inf] for ax in axes ]
+
+        sumw,_  = numpy.histogramdd(numpy.column_stack(values), bins=edges, weights=w)
+        sumw2,_ = numpy.histogramdd(numpy.column_stack(values), bins=edges, weights=w*w)
+
+        for idx in numpy.ndindex(*sumw.shape):
+            b = h.GetBin(*idx)
+            h.SetBinContent(b, sumw[idx])
+            h.SetBinError(b, math.sqrt(sumw2[idx]))
+
+        h.ResetStats()
+        h.SetEntries(len(w))
+        h.Scale(self._worker.scale)
+
+        return h
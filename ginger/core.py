@@ -1,8 +1,11 @@
 from abc import ABCMeta, abstractmethod
 import ROOT
 from . import odict
+from . import parallel
 import math
 import copy
+import numpy
+import cPickle
 
 # Sample
 # AbsDataSet
@@ -101,8 +104,266 @@ class ValErr:
 #  / / /  __/ / /_/ /
 # /_/_/\___/_/\__,_/
 #
-class Yield(ValErr):
-    pass
+class Yield(ValErr,object):
+    '''
+    A yield, held as sum of weights (value) and sum of squared weights
+    (sumw2), with the number of entries when known. Sums and scalings act
+    on sumw2 directly, so merges across shards, processes or cached
+    partials are exact: the error is only a square root taken on access.
+    '''
+    def __init__(self, y=0., ey=0., nentries=None):
+        self.value    = y
+        self.sumw2    = ey*ey
+        self.nentries = nentries
+
+    #---
+    @staticmethod
+    def fromsums(sumw, sumw2, nentries=None):
+        y = Yield(sumw, 0., nentries)
+        y.sumw2 = sumw2
+        return y
+
+    #---
+    @property
+    def error(self):
+        return math.sqrt(self.sumw2)
+
+    #---
+    @error.setter
+    def error(self, ey):
+        self.sumw2 = ey*ey
+
+    #---
+    @property
+    def sumw(self):
+        return self.value
+
+    #---
+    def __add__(self,other):
+        if not isinstance(other,ValErr):
+            return ValErr.__add__(self,other)
+
+        sumw2 = other.sumw2 if isinstance(other,Yield) else other.error**2
+        n     = getattr(other,'nentries',None)
+        return Yield.fromsums(self.value+other.value, self.sumw2+sumw2,
+                              self.nentries+n if (self.nentries is not None and n is not None) else None)
+
+    #---
+    def __radd__(self,other):
+        if isinstance(other,(int,float)):
+            return Yield.fromsums(other+self.value, self.sumw2, self.nentries)
+        return ValErr.__radd__(self,other)
+
+    #---
+    def __mul__(self,other):
+        '''numbers scale the yield, as TH1::Scale'''
+        if isinstance(other,(int,float)):
+            return Yield.fromsums(self.value*other, self.sumw2*other*other, self.nentries)
+        return ValErr.__mul__(self,other)
+
+    __rmul__ = __mul__
+
+    #---
+    def __div__(self,other):
+        if isinstance(other,(int,float)):
+            return self*(1./other)
+        return ValErr.__div__(self,other)
+
+# ---
+def _sumw2(y):
+    return y.sumw2 if isinstance(y,Yield) else y.error**2
+
+# ---
+class YieldVector(object):
+    '''
+    An array of yields (cut steps, regions, samples...), stored as sums of
+    weights and of squared weights in a numpy structured array. Unlike
+    ValErr, sums of vectors are exact and computed in one go.
+
+    Optionally labelled: items can be accessed by position or label. The
+    number of entries of each yield is kept, -1 when unknown.
+    '''
+    dtype = numpy.dtype([('sumw',numpy.float64),('sumw2',numpy.float64),('nentries',numpy.int64)])
+
+    #---
+    def __init__(self, sumw=(), sumw2=None, labels=None, nentries=None):
+        self._data = numpy.zeros(len(sumw), dtype=self.dtype)
+        self._data['sumw']  = sumw
+        self._data['sumw2'] = sumw2 if sumw2 is not None else 0.
+        self._data['nentries'] = nentries if nentries is not None else -1
+        self._labels = list(labels) if labels is not None else None
+
+        if self._labels is not None and len(self._labels) != len(self._data):
+            raise ValueError('Expected %d labels, found %d' % (len(self._data),len(self._labels)))
+
+    #---
+    @staticmethod
+    def fromyields(yields, labels=None):
+        '''from a list of ValErr, or an ordered dictionary of them (labelled)'''
+        if isinstance(yields,dict):
+            labels,yields = yields.keys(),yields.values()
+        nentries = [ getattr(y,'nentries',None) for y in yields ]
+        return YieldVector([ y.value for y in yields ], [ _sumw2(y) for y in yields ], labels,
+                           [ n if n is not None else -1 for n in nentries ])
+
+    #---
+    @staticmethod
+    def _wrap(data, labels):
+        v = YieldVector()
+        v._data   = data
+        v._labels = labels
+        return v
+
+    #---
+    def copy(self):
+        return YieldVector._wrap(self._data.copy(), list(self._labels) if self._labels is not None else None)
+
+    #---
+    @property
+    def labels(self):
+        return self._labels
+
+    @property
+    def sumw(self):
+        return self._data['sumw']
+
+    @property
+    def sumw2(self):
+        return self._data['sumw2']
+
+    @property
+    def nentries(self):
+        return self._data['nentries']
+
+    @property
+    def values(self):
+        return self._data['sumw']
+
+    @property
+    def errors(self):
+        return numpy.sqrt(self._data['sumw2'])
+
+    #---
+    def __len__(self):
+        return len(self._data)
+
+    #---
+    def _index(self, key):
+        if isinstance(key,str):
+            if self._labels is None: raise KeyError(key)
+            return self._labels.index(key)
+        return key
+
+    #---
+    def __getitem__(self, key):
+        if isinstance(key,slice):
+            return YieldVector._wrap(self._data[key].copy(), self._labels[key] if self._labels is not None else None)
+        d = self._data[self._index(key)]
+        n = int(d['nentries'])
+        return Yield.fromsums(float(d['sumw']), float(d['sumw2']), n if n >= 0 else None)
+
+    #---
+    def __setitem__(self, key, y):
+        i = self._index(key)
+        self._data['sumw'][i]  = y.value
+        self._data['sumw2'][i] = _sumw2(y)
+        n = getattr(y,'nentries',None)
+        self._data['nentries'][i] = n if n is not None else -1
+
+    #---
+    def __iter__(self):
+        for i in xrange(len(self._data)):
+            yield self[i]
+
+    #---
+    def __repr__(self):
+        items = [ '%s: %r' % (l,y) for l,y in zip(self._labels,self) ] if self._labels is not None else [ repr(y) for y in self ]
+        return '%s([%s])' % (self.__class__.__name__,', '.join(items))
+
+    #---
+    def toyields(self):
+        return list(self)
+
+    #---
+    def todict(self):
+        if self._labels is None: raise ValueError('Unlabelled vector')
+        return odict.OrderedDict(zip(self._labels,self))
+
+    #---
+    def _check(self, other):
+        if len(other) != len(self):
+            raise ValueError('Mismatching lengths %d and %d' % (len(self),len(other)))
+        if self._labels is not None and other._labels is not None and self._labels != other._labels:
+            raise ValueError('Mismatching labels')
+
+    #---
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    #---
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    #---
+    def merge(self, other):
+        '''adds other, in place: sums of weights and squared weights are summed'''
+        self._check(other)
+        self._data['sumw']  += other._data['sumw']
+        self._data['sumw2'] += other._data['sumw2']
+        # as Yield: the counts are summed if both are known
+        n,m = self._data['nentries'],other._data['nentries']
+        self._data['nentries'] = numpy.where((n >= 0) & (m >= 0), n+m, -1)
+        return self
+
+    #---
+    def scale(self, factor):
+        '''scales the yields in place, as TH1::Scale'''
+        self._data['sumw']  *= factor
+        self._data['sumw2'] *= factor*factor
+        return self
+
+    #---
+    def __mul__(self, factor):
+        return self.copy().scale(factor)
+
+    __rmul__ = __mul__
+
+    #---
+    def __div__(self, other):
+        '''
+        By a number: scaling. By a vector: ratios, with the relative errors
+        summed in quadrature as in ValErr
+        '''
+        if isinstance(other,(int,float)):
+            return self*(1./other)
+
+        self._check(other)
+        with numpy.errstate(divide='ignore',invalid='ignore'):
+            ratio = self.values/other.values
+            rel2  = self.sumw2/self.values**2+other.sumw2/other.values**2
+        return YieldVector(ratio, rel2*ratio**2, self._labels)
+
+    __truediv__ = __div__
+
+    #---
+    def dumps(self):
+        '''compact serialization: the raw arrays and the labels'''
+        return cPickle.dumps( (self._data.tobytes(),self._labels), cPickle.HIGHEST_PROTOCOL )
+
+    #---
+    @staticmethod
+    def loads(s):
+        data,labels = cPickle.loads(s)
+        return YieldVector._wrap(numpy.frombuffer(data,dtype=YieldVector.dtype).copy(),labels)
+
+    #---
+    def __getstate__(self):
+        return {'data': self._data.tobytes(), 'labels': self._labels}
+
+    #---
+    def __setstate__(self, state):
+        self._data   = numpy.frombuffer(state['data'],dtype=self.dtype).copy()
+        self._labels = state['labels']
 
 # _____________________________________________________________________________
 #     ____      __            ____
@@ -143,6 +404,8 @@ class Chained:
 
         self._oclass = theclass
         self._objs   = list(args)
+        # number of processes used to run the members (opt-in)
+        self.processes = 0
 
     def __iter__(self):
         return self._objs.__iter__()
@@ -159,15 +422,40 @@ class Chained:
     def remove(self,i):
         return self._objs.pop(i)
 
+    #---
+    def _fingerprint(self):
+        return [ o._fingerprint() for o in self._objs ]
+
+    #---
+    def _tasks(self, method, *args, **kwargs):
+        return sum([ o._tasks(method, *args, **kwargs) for o in self._objs ], [])
+
+    #---
+    def _parallel(self, method, *args, **kwargs):
+        '''Runs method on each of the underlying trees in a pool of processes'''
+        # pool processes can't start pools of their own
+        kwargs.pop('workers',None)
+        return parallel.runtasks(self._tasks(method, *args, **kwargs), self.processes)
+
     #---
     # here are the methods providing the default sum
-    def entries(self,cut=None):
-        return sum([ o.entries(cut) for o in self._objs  ])
+    def entries(self,cut=None,workers=0):
+        if self.processes:
+            return sum(self._parallel('entries', cut))
+
+        return sum([ o.entries(cut,workers) for o in self._objs  ])
 
     #---
     def yields(self, cut='', options='', *args, **kwargs):
         if not self._objs: return Yield(0,0)
 
+        if self.processes:
+            results = self._parallel('yields', cut, options, *args, **kwargs)
+            first = results[0]
+            for y in results[1:]:
+                first += y
+            return first
+
         first = self._objs[0].yields(cut,options,*args,**kwargs)
         for o in self._objs[1:]:
             first += o.yields(cut,options,*args,**kwargs)
@@ -191,10 +479,15 @@ class Chained:
             # free y binning
             ( len(bins) == 4 and isinstance(bins[3], (int,float)) )
            ):
-            # ValueError('Automatic binning not supported by ChainWorker
-            # (yet)')
-            print '\n-->',name,varexp,cut,options,bins,args, kwargs
-            raise ValueError('Automatic binning not supported by ChainWorker (yet)')
+            # the members must share the binning: scan first
+            bins = self._autobins(varexp, cut, bins)
+
+        if self.processes:
+            results = self._parallel('plot', name, varexp, cut, options, bins, *args, **kwargs)
+            first = results[0]
+            for hx in results[1:]:
+                first.Add(hx)
+            return first
 
         first = self._objs[0].plot(name,varexp,cut,options,bins,*args,**kwargs)
         for o in self._objs[1:]:
@@ -204,6 +497,109 @@ class Chained:
         return first
 
 
+    #---
+    def scan(self, exprs, cut='', keep=False):
+        '''Ranges of the expressions, over all the members (see TreeWorker.scan)'''
+        ranges = None
+        for o in self._objs:
+            r = o.scan(exprs, cut, keep)
+            ranges = r if ranges is None else odict.OrderedDict([ (e,ranges[e]+r[e]) for e in exprs ])
+        return ranges
+
+    #---
+    def _autobins(self, varexp, cut='', bins=None):
+        '''
+        Completes a free binning, as TTree::Draw would, with the ranges of the
+        variables over all the members
+        '''
+        from .loop import splitvarexp, autorange
+
+        exprs = splitvarexp(varexp)
+        if len(exprs) > 2:
+            raise ValueError('Automatic binning supported for 1D and 2D plots only')
+
+        ranges = self.scan(exprs, cut)
+        defaults = [ROOT.gEnv.GetValue('Hist.Binning.1D.x',100)] if len(exprs) == 1 else \
+                   [ROOT.gEnv.GetValue('Hist.Binning.2D.x',40),ROOT.gEnv.GetValue('Hist.Binning.2D.y',40)]
+
+        # bins given by the user: (nx,) or (nx,xmin,xmax,ny)
+        given = list(bins) if bins else []
+        nx = given[0] if given else defaults[0]
+        xbins = tuple(given[0:3]) if len(given) >= 3 else (nx,)+autorange(ranges[exprs[0]].min,ranges[exprs[0]].max,nx)
+
+        if len(exprs) == 1: return xbins
+
+        ny = given[3] if len(given) == 4 else defaults[1]
+        return xbins+(ny,)+autorange(ranges[exprs[1]].min,ranges[exprs[1]].max,ny)
+
+    #---
+    def book(self, name, varexp, bins, cut=''):
+        for o in self._objs:
+            o.book(name, varexp, bins, cut)
+
+    #---
+    def bookyields(self, name, cut=''):
+        for o in self._objs:
+            o.bookyields(name, cut)
+
+    #---
+    def bookflow(self, name, varexp, bins, cuts, cut='', offset=0):
+        for o in self._objs:
+            o.bookflow(name, varexp, bins, cuts, cut, offset)
+
+    #---
+    def bookyieldsflow(self, name, cuts, cut='', offset=0):
+        for o in self._objs:
+            o.bookyieldsflow(name, cuts, cut, offset)
+
+    #---
+    def bookregions(self, name, varexp, bins, regions, cut='', category=None):
+        for o in self._objs:
+            o.bookregions(name, varexp, bins, regions, cut, category)
+
+    #---
+    def bookyieldsregions(self, name, regions, cut='', category=None):
+        for o in self._objs:
+            o.bookyieldsregions(name, regions, cut, category)
+
+    #---
+    def bookvariations(self, name, varexp, bins, variations, cut=''):
+        for o in self._objs:
+            o.bookvariations(name, varexp, bins, variations, cut)
+
+    #---
+    def bookyieldsvariations(self, name, variations, cut=''):
+        for o in self._objs:
+            o.bookyieldsvariations(name, variations, cut)
+
+    #---
+    def bookscan(self, name, exprs, cut='', keep=False):
+        for o in self._objs:
+            o.bookscan(name, exprs, cut, keep)
+
+    #---
+    @staticmethod
+    def _merge(a, b):
+        '''sums two results: Yields, YieldVectors, Ranges, histograms or lists of them'''
+        from .loop import Range
+
+        if isinstance(a,list):
+            return [ Chained._merge(x,y) for x,y in zip(a,b) ]
+        elif isinstance(a,(ValErr,YieldVector,Range)):
+            return a+b
+        else:
+            a.Add(b)
+            return a
+
+    #---
+    def run(self):
+        results = odict.OrderedDict()
+        for o in self._objs:
+            for n,r in o.run().iteritems():
+                results[n] = self._merge(results[n],r) if n in results else r
+
+        return results
+
     #---
     def project(self, name, varexp, cut='', options='', bins=None, *args, **kwargs):
         for o in self._objs:
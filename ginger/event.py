@@ -1,5 +1,10 @@
 import ctypes
 import re
+import logging
+import functools
+import collections
+import numpy
+from .toolbox import TTreeBranchSentry
 
 #      ________      __  ______                 __ 
 #     / ____/ /___ _/ /_/ ____/   _____  ____  / /_
@@ -42,6 +47,23 @@ class Leaves:
     flag2type = dict(zip(flags,types))
     type2flag = dict(zip(types,flags))
 
+    # numpy equivalents, strings excluded
+    flag2dtype = {
+        'B': numpy.int8,
+        'b': numpy.uint8,
+        'S': numpy.int16,
+        's': numpy.uint16,
+        'I': numpy.int32,
+        'i': numpy.uint32,
+        'F': numpy.float32,
+        'D': numpy.float64,
+        'L': numpy.int64,
+        'l': numpy.uint64,
+        'O': numpy.bool_,
+    }
+
+_log = logging.getLogger('Event')
+
 class Event(object):
     '''this is an alternative way to access the TTree leaves for a flat tree'''
 
@@ -49,7 +71,6 @@ class Event(object):
     #---
     def __getattr__(self,name):
         try:
-            print name
             return self._leaves[name].value
         except KeyError:
             raise AttributeError(name)
@@ -80,7 +101,7 @@ class Event(object):
             # how do we check the branch is elemetary?
             m = expr.match(title)
             if not m:
-                print 'NOT Matched',title
+                _log.debug('not a flat branch: %s',title)
                 continue
             else:
                 name,t = m.groups()
@@ -99,11 +120,11 @@ class Event(object):
             # - O : [the letter 'o', not a zero] a boolean (Bool_t)
 
             if t not in Leaves.flag2type:
-                print 'Type',t,'not found'
+                _log.warning('type %s of %s not supported',t,name)
                 continue
 
             if name in self._leaves:
-                print 'What?? twice the same branch?!?',name
+                _log.warning('branch %s found twice',name)
                 continue
 
             leaf = Leaves.flag2type[t]()
@@ -135,7 +156,7 @@ Example:
 
 
     #--- 
-    def unlink(self,):
+    def unlink(self,t):
         self._linked.remove(t)
 
     #--- 
@@ -154,7 +175,7 @@ Example:
     def leafflag(self,name):
         ''' returns the type-flag of the variable '''
         try:
-            return Leaves.type2flag(self._leaves[name].__class__)
+            return Leaves.type2flag[self._leaves[name].__class__]
         except KeyError as e:
             raise e
 
@@ -175,3 +196,148 @@ Example:
             self._addleaf(n,t)
 
 
+# _____________________________________________________________________________
+#     ______                 __  ____                 __
+#    / ____/   _____  ____  / /_/ __ \___  ____ _____/ /__  _____
+#   / __/ | | / / _ \/ __ \/ __/ /_/ / _ \/ __ `/ __  / _ \/ ___/
+#  / /___ | |/ /  __/ / / / /_/ _, _/  __/ /_/ / /_/ /  __/ /
+# /_____/ |___/\___/_/ /_/\__/_/ |_|\___/\__,_/\__,_/\___/_/
+#
+
+_flatleaf = re.compile(r'^([a-zA-Z0-9_]+)/([%s])$' % ''.join(Leaves.flag2dtype))
+
+
+# ---
+def schema(tree, branches=None):
+    '''
+    The numpy record type of the flat, scalar, branches of tree (all of
+    them, or those in branches)
+    '''
+    fields = []
+    for b in tree.GetListOfBranches():
+        m = _flatleaf.match(b.GetTitle())
+        if not m or (branches is not None and m.group(1) not in branches): continue
+        fields.append( (m.group(1),Leaves.flag2dtype[m.group(2)]) )
+
+    if branches is not None:
+        missing = set(branches)-set([ n for n,t in fields ])
+        if missing:
+            raise ValueError('Not flat, scalar, branches: %s' % ', '.join(sorted(missing)))
+
+    return numpy.dtype(fields, align=True)
+
+
+_eventclasses = {}
+
+# ---
+def eventclass(dtype):
+    '''the record class of a schema: a namedtuple, made once per schema'''
+    cls = _eventclasses.get(dtype)
+    if cls is None:
+        cls = collections.namedtuple('Event', dtype.names, rename=True)
+        _eventclasses[dtype] = cls
+    return cls
+
+
+# ---
+class EventReader(object):
+    '''
+    Fast python loops on the flat, scalar, branches of a tree (or chain).
+
+    reader = EventReader(tree, ['mll','njet'])
+    for e in reader:
+        if e.njet == 0: h.Fill(e.mll)
+
+    for block in reader.blocks(10000):
+        sel = block[block.njet == 0]
+
+    The branches are read into a single numpy record: each entry is returned
+    as an immutable record (namedtuple of the schema), or copied into record
+    arrays of up to N entries. Only the entries in the active entrylist are
+    read and only the branches of the schema are enabled. The branch
+    addresses of the tree are reset at the end of each loop.
+    '''
+
+    # ---
+    def __init__(self, tree, branches=None):
+        self._tree = tree
+        self.dtype = schema(tree, branches)
+        self.Event = eventclass(self.dtype)
+
+    # ---
+    def __repr__(self):
+        return '%s(%s,%d branches)' % (self.__class__.__name__,self._tree.GetName(),len(self.dtype.names))
+
+    # ---
+    def __len__(self):
+        el = self._tree.GetEntryList()
+        return el.GetN() if el.__nonzero__() else self._tree.GetEntries()
+
+    # ---
+    def __iter__(self):
+        return self.events()
+
+    # ---
+    def _entries(self, first=0, nentries=None):
+        '''the entry numbers to read, through the active entrylist'''
+        n = len(self)
+        last = min(n, first+nentries) if nentries is not None else n
+
+        el = self._tree.GetEntryList()
+        if not el.__nonzero__(): return xrange(first,last)
+
+        getnumber = self._tree.GetEntryNumber
+        return ( getnumber(i) for i in xrange(first,last) )
+
+    # ---
+    def _attach(self):
+        rec = numpy.zeros(1, self.dtype)
+        sentry = TTreeBranchSentry([self._tree], self.dtype.names)
+        # the field views must live as long as the addresses
+        fields = [ rec[n] for n in self.dtype.names ]
+        for n,f in zip(self.dtype.names,fields):
+            self._tree.SetBranchAddress(n,f)
+        return rec, fields, sentry
+
+    # ---
+    def _detach(self, sentry):
+        self._tree.ResetBranchAddresses()
+        sentry.__del__()
+
+    # ---
+    def events(self, first=0, nentries=None):
+        '''one record per entry'''
+        make     = functools.partial(tuple.__new__, self.Event)
+        getentry = self._tree.GetEntry
+
+        rec,fields,sentry = self._attach()
+        try:
+            for entry in self._entries(first,nentries):
+                getentry(entry)
+                yield make(rec.item())
+        finally:
+            self._detach(sentry)
+
+    # ---
+    def blocks(self, size=10000, first=0, nentries=None):
+        '''numpy record arrays of up to size entries'''
+        if size <= 0:
+            raise ValueError('Block size must be positive (%d)' % size)
+
+        getentry = self._tree.GetEntry
+
+        rec,fields,sentry = self._attach()
+        try:
+            block = numpy.empty(size, self.dtype)
+            k = 0
+            for entry in self._entries(first,nentries):
+                getentry(entry)
+                block[k] = rec[0]
+                k += 1
+                if k == size:
+                    yield block.view(numpy.recarray)
+                    block = numpy.empty(size, self.dtype)
+                    k = 0
+            if k: yield block[:k].view(numpy.recarray)
+        finally:
+            self._detach(sentry)
@@ -0,0 +1,231 @@
+import ROOT
+import threading
+import logging
+import sys
+from . import odict
+
+# _____________________________________________________________________________
+#     ______                     __
+#    / ____/  _____  _______  __/ /_____  _____
+#   / __/ | |/_/ _ \/ ___/ / / / __/ __ \/ ___/
+#  / /____>  </  __/ /__/ /_/ / /_/ /_/ / /
+# /_____/_/|_|\___/\___/\__,_/\__/\____/_/
+#
+
+_log = logging.getLogger('executor')
+
+
+# ---
+class Future(object):
+    '''
+    The result of a request, made on the thread of the executor. A minimal
+    version of concurrent.futures.Future: result() blocks until the request
+    is processed, then turns it into the value of the future (see
+    _Request.finish) on the calling thread.
+    '''
+
+    # ---
+    def __init__(self, finish=None, lock=None):
+        self._finish    = finish
+        self._lock      = lock if lock is not None else threading.RLock()
+        self._event     = threading.Event()
+        self._finished  = False
+        self._result    = None
+        self._exc       = None
+        self._callbacks = []
+
+    # ---
+    def __repr__(self):
+        state = 'pending' if not self.done() else ('failed' if self._exc else 'done')
+        return '%s(%s)' % (self.__class__.__name__,state)
+
+    # ---
+    def done(self):
+        return self._event.is_set()
+
+    # ---
+    def _wait(self, timeout=None):
+        self._event.wait(timeout)
+        if not self.done():
+            raise RuntimeError('Request not processed in %ss' % timeout)
+
+        # finish once, on the first thread asking
+        with self._lock:
+            if self._finished: return
+            self._finished = True
+            if self._exc or not self._finish: return
+            try:
+                self._result = self._finish(self._result)
+            except Exception:
+                self._exc = sys.exc_info()
+
+    # ---
+    def result(self, timeout=None):
+        '''the result of the request; its exception is re-raised'''
+        self._wait(timeout)
+        if self._exc:
+            raise self._exc[0], self._exc[1], self._exc[2]
+        return self._result
+
+    # ---
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        return self._exc[1] if self._exc else None
+
+    # ---
+    def add_done_callback(self, fn):
+        '''
+        fn(future) is called when the request is processed, on the thread of
+        the executor, or right away if done
+        '''
+        if self.done():
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    # ---
+    def _set(self, result=None, exc=None):
+        self._result = result
+        self._exc    = exc
+        self._event.set()
+        for fn in self._callbacks:
+            try:
+                fn(self)
+            except Exception:
+                _log.exception('callback failed')
+
+
+# ---
+class _Request(object):
+    '''
+    view:   callable returning the view the request is booked on (None if
+            there is nothing to run, the result is then None), or None if
+            book makes the result on its own
+    book:   book(view, name), books the request on the view, or book() if
+            there is no view
+    finish: finish(result), turns the result of the run into the value of
+            the future, on the thread asking for it
+    '''
+    def __init__(self, view, book, finish, lock=None):
+        self.view   = view
+        self.book   = book
+        self.future = Future(finish, lock)
+
+
+# ---
+class LoopExecutor(object):
+    '''
+    Processes the requests on a background thread, in batches: those
+    booked on the same view are filled in a single event loop.
+
+    The thread only does the reading (views, bookings, event loops), while
+    holding lock, shared with the synchronous methods using the same chains.
+    ROOT thread safety is enabled when the executor is made (ROOT 6; with
+    ROOT 5 the lock is the only guard). The results are finished (cache,
+    filters) on the thread asking for them, holding the lock as well, so
+    that the process-wide ROOT flags (TH1::AddDirectory) are never flipped
+    by both threads at once.
+    '''
+
+    # ---
+    def __init__(self, lock=None):
+        self._lock   = lock if lock is not None else threading.RLock()
+        # guards the queue, never held while waiting for lock
+        self._cond   = threading.Condition()
+        self._queue  = []
+        self._busy   = False
+        self._thread = None
+
+        if hasattr(ROOT,'EnableThreadSafety'): ROOT.EnableThreadSafety()
+
+    # ---
+    def __repr__(self):
+        return '%s(%d pending)' % (self.__class__.__name__,len(self._queue))
+
+    # ---
+    def submit(self, view, book, finish):
+        '''queues a request and returns its Future'''
+        r = _Request(view, book, finish, self._lock)
+        with self._cond:
+            self._queue.append(r)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._serve, name='LoopExecutor')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify_all()
+        return r.future
+
+    # ---
+    def wait(self):
+        '''blocks until all the requests submitted so far are processed'''
+        with self._cond:
+            while self._queue or self._busy:
+                self._cond.wait()
+
+    # ---
+    def _serve(self):
+        # runs until the queue is empty, the next submit starts a new thread
+        while True:
+            # the requests queued while waiting for the lock join the batch
+            with self._lock:
+                with self._cond:
+                    if not self._queue:
+                        self._thread = None
+                        self._cond.notify_all()
+                        return
+                    batch, self._queue = self._queue, []
+                    self._busy = True
+                try:
+                    self._process(batch)
+                except Exception:
+                    _log.exception('batch failed')
+                finally:
+                    with self._cond:
+                        self._busy = False
+                        self._cond.notify_all()
+
+    # ---
+    def _process(self, batch):
+        # group the requests by view
+        groups = odict.OrderedDict()
+        for r in batch:
+            try:
+                if r.view is None:
+                    r.future._set(r.book())
+                    continue
+                view = r.view()
+            except Exception:
+                r.future._set(exc=sys.exc_info())
+                continue
+
+            if view is None:
+                r.future._set(None)
+            else:
+                groups.setdefault(id(view),(view,[]))[1].append(r)
+
+        for view,requests in groups.itervalues():
+            _log.debug('running %d requests on %s', len(requests), view)
+            self._run(view, requests)
+
+    # ---
+    def _run(self, view, requests):
+        booked = []
+        for i,r in enumerate(requests):
+            name = '__request%d' % i
+            try:
+                r.book(view, name)
+                booked.append( (name,r) )
+            except Exception:
+                r.future._set(exc=sys.exc_info())
+
+        if not booked: return
+
+        try:
+            results = view.run()
+        except Exception:
+            exc = sys.exc_info()
+            for name,r in booked: r.future._set(exc=exc)
+            return
+
+        for name,r in booked:
+            r.future._set(results[name])
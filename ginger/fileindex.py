@@ -0,0 +1,228 @@
+import ROOT
+import os
+import json
+import zlib
+import uuid
+import logging
+
+# _____________________________________________________________________________
+#     _______ __     ____          __
+#    / ____(_) /__  /  _/___  ____/ /__  _  __
+#   / /_  / / / _ \ / // __ \/ __  / _ \| |/_/
+#  / __/ / / /  __// // / / / /_/ /  __/>  <
+# /_/   /_/_/\___/___/_/ /_/\__,_/\___/_/|_|
+#
+# Sidecar index of the rootfiles of a directory: trees, entries, branches.
+# Used to build chains without opening the files; only the files with no
+# entries are left out, there is no pruning by cut.
+#
+
+_log = logging.getLogger('FileIndex')
+
+
+# ---
+def _split(path):
+    '''directory, name in the index (zip member included) and file on disk'''
+    filepath = path if '#' not in path else path[:path.index('#')]
+    return os.path.dirname(os.path.abspath(filepath)), os.path.basename(path), filepath
+
+
+# ---
+def _trees(d, prefix=''):
+    '''the trees found in a directory, recursively: {path: TTree}'''
+    trees = {}
+    for k in d.GetListOfKeys():
+        cl = ROOT.TClass.GetClass(k.GetClassName())
+        if not cl: continue
+        if cl.InheritsFrom('TTree'):
+            trees[prefix+k.GetName()] = k.ReadObj()
+        elif cl.InheritsFrom('TDirectory'):
+            trees.update( _trees(k.ReadObj(), prefix+k.GetName()+'/') )
+    return trees
+
+
+# ---
+def _adler32(filepath, blocksize=1<<20):
+    value = 1
+    with open(filepath,'rb') as f:
+        block = f.read(blocksize)
+        while block:
+            value = zlib.adler32(block, value)
+            block = f.read(blocksize)
+    return '%08x' % (value & 0xffffffff)
+
+
+# ---
+class FileIndex(object):
+    '''
+    The index of the rootfiles of a directory, stored next to them in a json
+    file. For each file: size and modification time (the records of files
+    changed since are ignored), the file UUID, optionally the adler32
+    checksum, and the entries and branches of each tree.
+    '''
+    filename = '.ginger_index.json'
+
+    # ---
+    def __init__(self, directory):
+        self._dir   = os.path.abspath(directory)
+        self._files = {}
+        self._mtime = None
+
+        self.load()
+
+    # ---
+    def __repr__(self):
+        return '%s(%r,%d files)' % (self.__class__.__name__,self._dir,len(self._files))
+
+    # ---
+    @property
+    def path(self):
+        return os.path.join(self._dir,self.filename)
+
+    # ---
+    def load(self):
+        if not os.path.exists(self.path): return
+
+        with open(self.path) as f:
+            self._files = json.load(f)
+        self._mtime = os.path.getmtime(self.path)
+
+    # ---
+    def stale(self):
+        '''True if the json file changed since it was loaded'''
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        return mtime != self._mtime
+
+    # ---
+    def save(self):
+        # write to a temporary file first, then move it in place
+        tmpname = '%s.%s' % (self.path,uuid.uuid1())
+        with open(tmpname,'w') as f:
+            json.dump(self._files, f, indent=1, sort_keys=True)
+        os.rename(tmpname,self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    # ---
+    def record(self, path):
+        '''the record of path, None if missing or out of date'''
+        d,name,filepath = _split(path)
+        r = self._files.get(name)
+        if not r: return None
+
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        if r['size'] != st.st_size or r['mtime'] != int(st.st_mtime): return None
+
+        return r
+
+    # ---
+    def entries(self, path, tree):
+        r = self.record(path)
+        if not r or tree not in r['trees']: return None
+        return r['trees'][tree]['entries']
+
+    # ---
+    def branches(self, path, tree):
+        r = self.record(path)
+        if not r or tree not in r['trees']: return None
+        return r['trees'][tree]['branches']
+
+    # ---
+    def update(self, paths, checksums=False):
+        '''
+        (Re)indexes the files without an up to date record.
+        checksums: compute the adler32 checksum (reads the whole file)
+        '''
+        n = 0
+        for path in paths:
+            d,name,filepath = _split(path)
+            if d != self._dir:
+                raise ValueError('%s is not in %s' % (path,self._dir))
+            if self.record(path) and (not checksums or 'adler32' in self._files[name]): continue
+
+            st = os.stat(filepath)
+            f = ROOT.TFile.Open(path)
+            if not f or f.IsZombie():
+                raise RuntimeError('Failed to open %s' % path)
+
+            trees = {}
+            for tname,t in _trees(f).iteritems():
+                trees[tname] = {
+                    'entries' : t.GetEntries(),
+                    'branches': sorted([ b.GetName() for b in t.GetListOfBranches() ]),
+                }
+
+            r = {
+                'size' : st.st_size,
+                'mtime': int(st.st_mtime),
+                'uuid' : f.GetUUID().AsString(),
+                'trees': trees,
+            }
+            f.Close()
+            if checksums: r['adler32'] = _adler32(filepath)
+
+            self._files[name] = r
+            n += 1
+
+        _log.debug('indexed %d files in %s', n, self._dir)
+        return n
+
+
+_indexes = {}
+
+# ---
+def indexof(directory):
+    '''the FileIndex of a directory, loaded once (and again if it changes)'''
+    directory = os.path.abspath(directory)
+    idx = _indexes.get(directory)
+    if idx is None or idx.stale():
+        idx = FileIndex(directory)
+        _indexes[directory] = idx
+    return idx
+
+
+# ---
+def entrycounts(files, tree):
+    '''
+    The entries of tree in each file, from the indexes of their directories.
+    None unless all the files have an up to date record. A null count is
+    the only information used to leave a file out of a chain.
+    '''
+    counts  = []
+    indexes = {}
+    for path in files:
+        d = _split(path)[0]
+        if d not in indexes:
+            indexes[d] = indexof(d) if os.path.exists(os.path.join(d,FileIndex.filename)) else None
+        if not indexes[d]: return None
+
+        n = indexes[d].entries(path,tree)
+        if n is None: return None
+        counts.append(n)
+
+    return counts
+
+
+# ---
+def buildindex(files, checksums=False):
+    '''Indexes the files, writing one index per directory'''
+    bydir = {}
+    for path in files:
+        bydir.setdefault(_split(path)[0],[]).append(path)
+
+    for d,paths in bydir.iteritems():
+        idx = indexof(d)
+        if idx.update(paths, checksums): idx.save()
+
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [--checksums] file.root ...')
+    parser.add_option('--checksums', action='store_true', default=False, help='compute the adler32 checksums')
+    opts,args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG)
+    buildindex(args, opts.checksums)
@@ -0,0 +1,332 @@
+import re
+import math
+import numpy
+
+# _____________________________________________________________________________
+#     ______                           __
+#    / ____/___  _________ ___  __  __/ /___ _
+#   / /_  / __ \/ ___/ __ `__ \/ / / / / __ `/
+#  / __/ / /_/ / /  / / / / / / /_/ / / /_/ /
+# /_/    \____/_/  /_/ /_/ /_/\__,_/_/\__,_/
+#
+# Translation of TTreeFormula expressions into vectorized numpy code
+#
+
+_token = re.compile(r'''
+    \s*(?:
+      (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<name>[A-Za-z_][A-Za-z0-9_$]*(?:::[A-Za-z_][A-Za-z0-9_]*)*)
+    | (?P<op>&&|\|\||==|!=|<=|>=|\*\*|[<>!+\-*/%^&|()\[\],])
+    )''', re.VERBOSE)
+
+# functions, TTreeFormula name: numpy function
+_functions = {
+    'abs'         : 'absolute',
+    'fabs'        : 'absolute',
+    'sqrt'        : 'sqrt',
+    'exp'         : 'exp',
+    'log'         : 'log',
+    'log10'       : 'log10',
+    'pow'         : 'power',
+    'cos'         : 'cos',
+    'sin'         : 'sin',
+    'tan'         : 'tan',
+    'acos'        : 'arccos',
+    'asin'        : 'arcsin',
+    'atan'        : 'arctan',
+    'atan2'       : 'arctan2',
+    'cosh'        : 'cosh',
+    'sinh'        : 'sinh',
+    'tanh'        : 'tanh',
+    'floor'       : 'floor',
+    'ceil'        : 'ceil',
+    'min'         : 'minimum',
+    'max'         : 'maximum',
+    'TMath::Abs'  : 'absolute',
+    'TMath::Sqrt' : 'sqrt',
+    'TMath::Exp'  : 'exp',
+    'TMath::Log'  : 'log',
+    'TMath::Log10': 'log10',
+    'TMath::Power': 'power',
+    'TMath::Cos'  : 'cos',
+    'TMath::Sin'  : 'sin',
+    'TMath::Tan'  : 'tan',
+    'TMath::ACos' : 'arccos',
+    'TMath::ASin' : 'arcsin',
+    'TMath::ATan' : 'arctan',
+    'TMath::ATan2': 'arctan2',
+    'TMath::CosH' : 'cosh',
+    'TMath::SinH' : 'sinh',
+    'TMath::TanH' : 'tanh',
+    'TMath::Floor': 'floor',
+    'TMath::Ceil' : 'ceil',
+    'TMath::Min'  : 'minimum',
+    'TMath::Max'  : 'maximum',
+    'TMath::Hypot': 'hypot',
+}
+
+# constants, TTreeFormula name: value
+_constants = {
+    'true'          : 1.,
+    'false'         : 0.,
+    'pi'            : math.pi,
+    'TMath::Pi'     : math.pi,
+    'TMath::TwoPi'  : 2*math.pi,
+    'TMath::PiOver2': math.pi/2,
+    'TMath::E'      : math.e,
+}
+
+# global namespace of the compiled expressions
+_namespace = dict( (f,getattr(numpy,f)) for f in set(_functions.itervalues()) )
+_namespace.update({
+    'logical_and': numpy.logical_and,
+    'logical_or' : numpy.logical_or,
+    'logical_not': numpy.logical_not,
+    'bitwise_and': numpy.bitwise_and,
+    'bitwise_or' : numpy.bitwise_or,
+    'fmod'       : numpy.fmod,
+    '_num'       : lambda x: numpy.asarray(x, dtype=numpy.float64),
+    '_int'       : lambda x: numpy.asarray(x, dtype=numpy.int64),
+    '__builtins__': None,
+})
+
+
+# ---
+def _tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = _token.match(expr,pos)
+        if not m:
+            raise SyntaxError('Unexpected character at %d in \'%s\'' % (pos,expr))
+        tokens.append( (m.lastgroup, m.group(m.lastgroup)) )
+        pos = m.end()
+    return tokens
+
+
+# ---
+class _Parser(object):
+    '''
+    Recursive descent parser, following the C operator precedence.
+    Each rule returns a tuple (code, isbool).
+    '''
+
+    # ---
+    def __init__(self, expr, aliases, columns, stack=()):
+        self._expr    = expr
+        self._tokens  = _tokenize(expr)
+        self._pos     = 0
+        self._aliases = aliases
+        self._columns = columns
+        self._stack   = stack
+
+    # ---
+    def _error(self, msg):
+        raise SyntaxError('%s in \'%s\'' % (msg,self._expr))
+
+    # ---
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else (None,None)
+
+    # ---
+    def _next(self):
+        tok = self._peek()
+        if tok[0] is None: self._error('Unexpected end of expression')
+        self._pos += 1
+        return tok
+
+    # ---
+    def _accept(self, *ops):
+        kind,value = self._peek()
+        if kind == 'op' and value in ops:
+            self._pos += 1
+            return value
+        return None
+
+    # ---
+    def _expect(self, op):
+        if not self._accept(op): self._error('Expected \'%s\'' % op)
+
+    # ---
+    def parse(self):
+        node = self._or()
+        if self._pos != len(self._tokens):
+            self._error('Unexpected \'%s\'' % self._peek()[1])
+        return node
+
+    # ---
+    def _binary(self, sub, ops, make):
+        left = sub()
+        op = self._accept(*ops)
+        while op:
+            right = sub()
+            left  = make(op,left,right)
+            op = self._accept(*ops)
+        return left
+
+    # ---
+    def _or(self):
+        return self._binary(self._and, ['||'], lambda op,l,r: ('logical_or(%s, %s)' % (l[0],r[0]), True))
+
+    def _and(self):
+        return self._binary(self._bitor, ['&&'], lambda op,l,r: ('logical_and(%s, %s)' % (l[0],r[0]), True))
+
+    def _bitor(self):
+        return self._binary(self._bitand, ['|'], lambda op,l,r: ('bitwise_or(_int(%s), _int(%s))' % (l[0],r[0]), False))
+
+    def _bitand(self):
+        return self._binary(self._equality, ['&'], lambda op,l,r: ('bitwise_and(_int(%s), _int(%s))' % (l[0],r[0]), False))
+
+    def _equality(self):
+        return self._binary(self._relational, ['==','!='], lambda op,l,r: ('(%s %s %s)' % (l[0],op,r[0]), True))
+
+    def _relational(self):
+        return self._binary(self._additive, ['<','<=','>','>='], lambda op,l,r: ('(%s %s %s)' % (l[0],op,r[0]), True))
+
+    def _additive(self):
+        return self._binary(self._multiplicative, ['+','-'], lambda op,l,r: ('(%s %s %s)' % (_asnum(l),op,_asnum(r)), False))
+
+    def _multiplicative(self):
+        def make(op,l,r):
+            if op == '%': return ('fmod(%s, %s)' % (_asnum(l),_asnum(r)), False)
+            return ('(%s %s %s)' % (_asnum(l),op,_asnum(r)), False)
+        return self._binary(self._unary, ['*','/','%'], make)
+
+    # ---
+    def _unary(self):
+        op = self._accept('!','-','+')
+        if op == '!':
+            node = self._unary()
+            return ('logical_not(%s)' % node[0], True)
+        elif op:
+            node = self._unary()
+            return ('(%s%s)' % (op,_asnum(node)), False)
+        return self._power()
+
+    # ---
+    def _power(self):
+        base = self._primary()
+        if self._accept('^','**'):
+            # right associative
+            exp = self._unary()
+            return ('power(%s, %s)' % (_asnum(base),_asnum(exp)), False)
+        return base
+
+    # ---
+    def _primary(self):
+        kind,value = self._next()
+
+        if kind == 'number':
+            return (repr(float(value)), False)
+        elif kind == 'op' and value == '(':
+            node = self._or()
+            self._expect(')')
+            return ('(%s)' % node[0], node[1])
+        elif kind == 'name':
+            if self._accept('('):
+                return self._call(value)
+            elif value in _constants:
+                return (repr(_constants[value]), False)
+            elif value in self._aliases:
+                return self._alias(value)
+            else:
+                return self._column(value)
+
+        self._error('Unexpected \'%s\'' % value)
+
+    # ---
+    def _call(self, name):
+        args = []
+        if not self._accept(')'):
+            args.append(self._or())
+            while self._accept(','):
+                args.append(self._or())
+            self._expect(')')
+
+        # constants can be called as functions (TMath::Pi())
+        if name in _constants and not args:
+            return (repr(_constants[name]), False)
+        if name not in _functions:
+            self._error('Unknown function \'%s\'' % name)
+
+        return ('%s(%s)' % (_functions[name], ', '.join([_asnum(a) for a in args])), False)
+
+    # ---
+    def _alias(self, name):
+        if name in self._stack:
+            self._error('Recursive alias \'%s\'' % name)
+        sub = _Parser(self._aliases[name], self._aliases, self._columns, self._stack+(name,))
+        node = sub.parse()
+        return ('(%s)' % node[0], node[1])
+
+    # ---
+    def _column(self, name):
+        # fixed indexes only: jetpt[0]
+        while self._accept('['):
+            kind,index = self._next()
+            if kind != 'number' or not index.isdigit():
+                self._error('Only constant indexes are supported')
+            self._expect(']')
+            name += '[%s]' % index
+
+        if name not in self._columns:
+            self._columns.append(name)
+
+        return ('_c[%d]' % self._columns.index(name), False)
+
+
+# ---
+def _asnum(node):
+    '''booleans used in arithmetics are turned into numbers, as in TTreeFormula'''
+    return '_num(%s)' % node[0] if node[1] else node[0]
+
+
+# ---
+class Formula(object):
+    '''
+    A TTreeFormula-like expression compiled into a numpy evaluator.
+
+    columns:  the columns (branches, or indexed branches as 'jetpt[0]') the
+              formula needs, aliases expanded
+    branches: the names of the underlying branches
+    '''
+
+    # ---
+    def __init__(self, expr, aliases={}):
+        self.expr    = expr
+        self.columns = []
+
+        code, isbool = _Parser(expr, aliases, self.columns).parse()
+        self.code     = code
+        self.branches = set([ c.split('[')[0] for c in self.columns ])
+        self._func    = eval('lambda _c: %s' % code, _namespace)
+
+    # ---
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__,self.expr)
+
+    # ---
+    def __call__(self, columns):
+        '''
+        columns: dictionary of numpy arrays, including 'Entry$'
+        '''
+        value = self._func([ columns[c] for c in self.columns ])
+        # constant expressions
+        if numpy.ndim(value) == 0:
+            value = numpy.full(len(columns['Entry$']), value, dtype=numpy.float64)
+        return value
+
+
+_cache = {}
+
+# ---
+def compileexpr(expr, aliases={}):
+    '''
+    Returns the Formula for expr, compiled once and reused for any worker
+    with the same aliases
+    '''
+    key = (str(expr), tuple(sorted(aliases.iteritems())))
+    if key not in _cache:
+        _cache[key] = Formula(str(expr), aliases)
+    return _cache[key]
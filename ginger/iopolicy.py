@@ -0,0 +1,235 @@
+import ROOT
+import time
+import logging
+
+# _____________________________________________________________________________
+#     ____      ______  ____        ___
+#    /  _/___  / ____/ / __ \____  / (_)______  __
+#    / // __ \/ /     / /_/ / __ \/ / / ___/ / / /
+#  _/ // /_/ / /___  / ____/ /_/ / / / /__/ /_/ /
+# /___/\____/\____/ /_/    \____/_/_/\___/\__, /
+#                                        /____/
+#
+
+
+# ---
+class IOStats(object):
+    '''
+    Reads done by the loops run under a policy, and the efficiency of the
+    read cache of each file read (see IOPolicy.collect)
+    '''
+
+    # ---
+    def __init__(self):
+        self.reset()
+
+    # ---
+    def __repr__(self):
+        return '%s(loops=%d,files=%d,bytes=%d,calls=%d,bytes/call=%.0f,efficiency=%.3f,efficiencyrel=%.3f,time=%.2fs)' % (self.__class__.__name__,
+            self.loops, len(self.files), self.bytes, self.calls, self.bytespercall, self.efficiency, self.efficiencyrel, self.time)
+
+    # ---
+    def reset(self):
+        self.loops = 0
+        self.bytes = 0
+        self.calls = 0
+        self.time  = 0.
+        # (file name, bytes read, efficiency, relative efficiency)
+        self.files = []
+
+    # ---
+    @property
+    def bytespercall(self):
+        '''
+        Average size of the reads, over all the files and loops: the cache
+        turns many small reads into few large ones
+        '''
+        return float(self.bytes)/self.calls if self.calls else 0.
+
+    # ---
+    def _average(self, i):
+        total = sum([ f[1] for f in self.files ])
+        return sum([ f[1]*f[i] for f in self.files ])/float(total) if total else 0.
+
+    # ---
+    @property
+    def efficiency(self):
+        '''TTreeCache::GetEfficiency of the files, weighted by the bytes read'''
+        return self._average(2)
+
+    # ---
+    @property
+    def efficiencyrel(self):
+        '''TTreeCache::GetEfficiencyRel of the files, weighted by the bytes read'''
+        return self._average(3)
+
+
+# ---
+class PrefetchSentry(object):
+    '''
+    Sets the asynchronous prefetching of the files opened meanwhile (read
+    by TFile when it is opened), then restores it
+    '''
+
+    # ---
+    def __init__(self, prefetch):
+        self._async = ROOT.gEnv.GetValue('TFile.AsyncPrefetching',0)
+        ROOT.gEnv.SetValue('TFile.AsyncPrefetching',int(prefetch))
+
+    # ---
+    def __del__(self):
+        if self._async is None: return
+        ROOT.gEnv.SetValue('TFile.AsyncPrefetching',self._async)
+        self._async = None
+
+    # ---
+    def __enter__(self):
+        return self
+
+    # ---
+    def __exit__(self, type, value, tb):
+        self.__del__()
+
+
+# ---
+class IOSentry(object):
+    '''
+    Configures the read cache of the trees for the duration of a loop, then
+    records the reads in the stats of the policy
+    '''
+
+    # ---
+    def __init__(self, policy, trees, branches=None):
+        self._policy = policy
+        self._trees  = trees
+        self._done   = False
+
+        # before any file is opened, by configure or by the loop
+        self._prefetch = PrefetchSentry(policy.prefetch)
+
+        for t in trees:
+            policy.configure(t, branches)
+
+        # bytes already read from the files open now, by previous loops
+        self._filebytes = {}
+        for t in trees:
+            f = t.GetCurrentFile()
+            if f: self._filebytes[f.GetName()] = f.GetBytesRead()
+
+        self._bytes = ROOT.TFile.GetFileBytesRead()
+        self._calls = ROOT.TFile.GetFileReadCalls()
+        self._start = time.time()
+
+    # ---
+    def collect(self):
+        '''
+        Records the cache efficiency of the files the trees are reading: to
+        be called before the chains move to the next file
+        '''
+        for t in self._trees:
+            self._policy.collect(t, self._filebytes)
+
+    # ---
+    def __del__(self):
+        if self._done: return
+        self._done = True
+
+        # the files read last
+        self.collect()
+
+        stats = self._policy.stats
+        stats.loops += 1
+        stats.bytes += ROOT.TFile.GetFileBytesRead()-self._bytes
+        stats.calls += ROOT.TFile.GetFileReadCalls()-self._calls
+        stats.time  += time.time()-self._start
+
+        self._prefetch.__del__()
+
+    # ---
+    def __enter__(self):
+        return self
+
+    # ---
+    def __exit__(self, type, value, tb):
+        self.__del__()
+
+
+# ---
+class IOPolicy(object):
+    '''
+    TTreeCache configuration applied to the chains (and their friends)
+    before each loop.
+
+    cachesize: size of the cache in bytes, 0 disables it
+    learn:     entries used by the cache to learn the branches to read
+    register:  register the branches used by the request in the cache, if
+               known, and skip the learning phase
+    prefetch:  asynchronous prefetching of the baskets, for the files opened
+               while the policy is in use: set the policy before the chain
+               is loaded (lazy worker) for it to apply to the first file
+    '''
+    _log = logging.getLogger('IOPolicy')
+
+    # ---
+    def __init__(self, cachesize=30*1024*1024, learn=100, register=True, prefetch=False):
+        self.cachesize = cachesize
+        self.learn     = learn
+        self.register  = register
+        self.prefetch  = prefetch
+        self.stats     = IOStats()
+
+    # ---
+    def __repr__(self):
+        return '%s(size=%d,learn=%d,register=%s,prefetch=%s)' % (self.__class__.__name__,
+            self.cachesize, self.learn, self.register, self.prefetch)
+
+    # ---
+    def configure(self, tree, branches=None):
+        tree.SetCacheSize(self.cachesize)
+        if self.cachesize <= 0: return
+
+        tree.SetCacheLearnEntries(self.learn)
+        if not self.register or branches is None: return
+
+        # the cache of a chain belongs to its current file: open one first
+        if tree.LoadTree(max(tree.GetReadEntry(),0)) < 0: return
+
+        # replace the branches registered for the previous loop
+        tree.DropBranchFromCache('*',True)
+        names = set([ b.GetName() for b in tree.GetListOfBranches() ])
+        for b in branches:
+            if b in names: tree.AddBranchToCache(b,True)
+        tree.StopCacheLearningPhase()
+
+        self._log.debug('%s: %d branches registered', tree.GetName(), len(names & set(branches)))
+
+    # ---
+    def cacheof(self, tree):
+        '''the cache of the file currently read by tree, if any'''
+        f = tree.GetCurrentFile()
+        if not f: return None
+        cache = f.GetCacheRead(tree.GetTree() if tree.InheritsFrom('TChain') else tree)
+        return cache if cache else None
+
+    # ---
+    def collect(self, tree, since=None):
+        '''
+        Records in the stats the efficiency of the cache of the file
+        currently read by tree, with the bytes read from it (minus those in
+        since, by file name). The cache of a chain is lost when it moves to
+        the next file: the event loop collects it at each file switch, a
+        TTree::Draw only at the end, for the last file.
+        '''
+        cache = self.cacheof(tree)
+        if cache is None: return
+
+        f = tree.GetCurrentFile()
+        nbytes = f.GetBytesRead()-(since or {}).pop(f.GetName(),0)
+        if nbytes <= 0: return
+
+        self.stats.files.append( (f.GetName(), nbytes, cache.GetEfficiency(), cache.GetEfficiencyRel()) )
+        self._log.debug('%s: %d bytes, efficiency %.3f (rel %.3f)', f.GetName(), nbytes, cache.GetEfficiency(), cache.GetEfficiencyRel())
+
+    # ---
+    def sentry(self, trees, branches=None):
+        return IOSentry(self, trees, branches)
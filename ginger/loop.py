@@ -0,0 +1,704 @@
+import ROOT
+import re
+import math
+import array
+import numpy
+import logging
+from .core import Yield, YieldVector
+
+
+# _____________________________________________________________________________
+#     ______                 __  __
+#    / ____/   _____  ____  / /_/ /   ____  ____  ____
+#   / __/ | | / / _ \/ __ \/ __/ /   / __ \/ __ \/ __ \
+#  / /___ | |/ /  __/ / / / /_/ /___/ /_/ / /_/ / /_/ /
+# /_____/ |___/\___/_/ /_/\__/_____/\____/\____/ .___/
+#                                             /_/
+
+# split 'y:x' but not 'TMath::Abs(x)'
+_colonsplit = re.compile(r'(?<!:):(?!:)')
+
+
+# ---
+def splitvarexp(varexp):
+    '''
+    Splits a TTree::Draw varexp in its components, following the TTree
+    convention: 'x' -> ['x'], 'y:x' -> ['x','y'] (i.e. returned in the order
+    expected by TH1::Fill)
+    '''
+    return list(reversed(_colonsplit.split(varexp)))
+
+
+# ---
+class _Formulas(dict):
+    '''
+    The compiled expressions, and the set of those with multiple instances
+    per entry (arrays).
+
+    The values are cached for the current entry: an expression shared by
+    several bookings (weight, cuts) is evaluated once per entry. reset()
+    must be called when moving to the next entry.
+    '''
+    def __init__(self):
+        super(_Formulas,self).__init__()
+        self.multiple = set()
+        self._ndata   = {}
+        self._values  = {}
+
+    # ---
+    def reset(self):
+        self._ndata.clear()
+        self._values.clear()
+
+    # ---
+    def ndata(self, e):
+        n = self._ndata.get(e)
+        if n is None:
+            # GetNdata triggers the loading of the leaves
+            n = self._ndata[e] = self[e].GetNdata()
+        return n
+
+    # ---
+    def value(self, e, i=0):
+        '''instance i of e, 0 if missing'''
+        key = (e,i)
+        v = self._values.get(key)
+        if v is None:
+            v = self[e].EvalInstance(i) if self.ndata(e) > i else 0.
+            self._values[key] = v
+        return v
+
+
+# ---
+def _evalweight(formulas, weight):
+    if not weight: return 1.
+    return formulas.value(weight)
+
+
+# ---
+def _ninstances(formulas, exprs):
+    '''
+    Number of instances of the expressions in the current entry, as
+    TTree::Draw: the shortest of the arrays, the scalars being repeated. 0 if
+    any of them has no value.
+    '''
+    ndata = [ formulas.ndata(e) for e in exprs ]
+    if not ndata: return 1
+    if min(ndata) <= 0: return 0
+    arrays = [ n for e,n in zip(exprs,ndata) if e in formulas.multiple ]
+    return min(arrays) if arrays else 1
+
+
+# ---
+def _evalinstance(formulas, e, i):
+    return formulas.value(e, i if e in formulas.multiple else 0)
+
+
+# ---
+def _fillvars(hist, formulas, vars, w):
+    # loop over the instances of array-like expressions
+    for i in xrange(_ninstances(formulas, vars)):
+        args = [_evalinstance(formulas,v,i) for v in vars]+[w]
+        hist.Fill(*args)
+
+
+# ---
+def _fillinstances(hist, formulas, vars, weight):
+    '''
+    As TTree::Draw for a weight (selection) with multiple instances: the
+    weight is evaluated per instance, together with the variables
+    '''
+    for i in xrange(_ninstances(formulas, vars+[weight])):
+        w = formulas.value(weight,i)
+        if w == 0.: continue
+        args = [_evalinstance(formulas,v,i) for v in vars]+[w]
+        hist.Fill(*args)
+
+
+# ---
+def _depth(formulas, cuts, offset):
+    '''number of consecutive cuts passed, starting from offset'''
+    depth = offset
+    for c in cuts:
+        if formulas.value(c) == 0.: break
+        depth += 1
+    return depth
+
+
+# ---
+class HistBooking(object):
+    '''
+    A histogram to be filled by the EventLoop
+
+    vars:   list of expressions, in TH1::Fill order
+    weight: weight*cut expression (as produced by TreeWorker._cutexpr)
+    '''
+    def __init__(self, hist, varexp, weight=''):
+        self.hist   = hist
+        self.vars   = splitvarexp(varexp)
+        self.weight = weight
+
+        if len(self.vars) != hist.GetDimension():
+            raise ValueError('Dimension mismatch between \'%s\' and %s (%dD)' % (varexp, hist.GetName(), hist.GetDimension()))
+
+    # ---
+    def expressions(self):
+        return self.vars + ([self.weight] if self.weight else [])
+
+    # ---
+    def scalars(self):
+        return []
+
+    # ---
+    def fill(self, formulas):
+        if self.weight in formulas.multiple:
+            _fillinstances(self.hist, formulas, self.vars, self.weight)
+            return
+
+        w = _evalweight(formulas, self.weight)
+        if w == 0.: return
+
+        _fillvars(self.hist, formulas, self.vars, w)
+
+    # ---
+    def result(self, scale=1.):
+        self.hist.Scale(scale)
+        return self.hist
+
+
+# ---
+class YieldBooking(object):
+    '''
+    A yield (sum of weights and sum of squared weights) to be filled by the
+    EventLoop
+    '''
+    def __init__(self, weight=''):
+        self.weight = weight
+        self.sumw   = 0.
+        self.sumw2  = 0.
+        self.n      = 0
+
+    # ---
+    def expressions(self):
+        return [self.weight] if self.weight else []
+
+    # ---
+    def scalars(self):
+        return []
+
+    # ---
+    def fill(self, formulas):
+        if self.weight in formulas.multiple:
+            # as TTree::Draw, one count per instance passing
+            ws = [ formulas.value(self.weight,i) for i in xrange(formulas.ndata(self.weight)) ]
+        else:
+            ws = [ _evalweight(formulas, self.weight) ]
+
+        for w in ws:
+            if w == 0.: continue
+            self.sumw  += w
+            self.sumw2 += w*w
+            self.n     += 1
+
+    # ---
+    def result(self, scale=1.):
+        return Yield.fromsums(self.sumw*scale, self.sumw2*scale*scale, self.n)
+
+
+# ---
+class EventLoop(object):
+    '''
+    Fills a collection of bookings with a single pass over a chain.
+
+    The loop honours the entrylist currently attached to the chain. Each
+    expression is compiled once into a TTreeFormula, shared among all the
+    bookings using it, therefore every branch is read at most once per entry.
+
+    Array-like expressions are looped over as TTree::Draw does (see
+    _ninstances). The cuts the bookings evaluate once per entry (flows,
+    regions, variations: see their scalars method) must be scalar.
+
+    The loop costs a few python calls per entry and formula: for a single
+    histogram TTree::Draw is faster, the loop pays off when it replaces
+    several passes (see tests/benchloop.py).
+    '''
+    _log = logging.getLogger('EventLoop')
+
+    # ---
+    def __init__(self, chain, onswitch=None):
+        self._chain    = chain
+        self._formulas = _Formulas()
+        # called before the chain leaves a file
+        self._onswitch = onswitch
+
+    # ---
+    def _compile(self, expr):
+        if expr in self._formulas:
+            return self._formulas[expr]
+
+        f = ROOT.TTreeFormula('loop%d' % len(self._formulas), expr, self._chain)
+        if f.GetNdim() == 0:
+            raise ValueError('Failed to compile expression \'%s\'' % expr)
+        self._formulas[expr] = f
+        if f.GetMultiplicity(): self._formulas.multiple.add(expr)
+        return f
+
+    # ---
+    def multiple(self, exprs):
+        '''the expressions with multiple instances per entry (arrays)'''
+        arrays = []
+        for e in exprs:
+            if not e: continue
+            self._compile(str(e))
+            if str(e) in self._formulas.multiple: arrays.append(e)
+        return arrays
+
+    # ---
+    def run(self, bookings, first=0, nentries=None):
+        '''
+        bookings: ordered dictionary of bookings
+        first, nentries: range of entries to process (indexes in the active entrylist, if any)
+        '''
+
+        for b in bookings.itervalues():
+            for e in b.expressions():
+                self._compile(e)
+            arrays = self.multiple(b.scalars())
+            if arrays:
+                raise ValueError('%s: array-like cuts are not supported (%s), use the TTree::Draw based methods' % (b.__class__.__name__, ', '.join(arrays)))
+
+        elist = self._chain.GetEntryList()
+        total = elist.GetN() if elist.__nonzero__() else self._chain.GetEntries()
+        last  = total if nentries is None else min(total, first+nentries)
+
+        self._log.debug('looping over entries [%d,%d) with %d formulas', first, last, len(self._formulas))
+
+        formulas = self._formulas
+        bvalues  = bookings.values()
+        treenum  = -1
+        # entries of the current file
+        lo,hi    = 0,-1
+
+        for i in xrange(first, last):
+            entry = self._chain.GetEntryNumber(i)
+            if entry < 0: break
+            if self._onswitch and treenum >= 0 and not lo <= entry < hi:
+                self._onswitch()
+            if self._chain.LoadTree(entry) < 0: break
+
+            # the chain moved to a new file: update the leaves
+            if self._chain.GetTreeNumber() != treenum:
+                treenum = self._chain.GetTreeNumber()
+                lo = self._chain.GetChainOffset()
+                hi = lo+self._chain.GetTree().GetEntries()
+                for f in formulas.itervalues():
+                    f.UpdateFormulaLeaves()
+
+            # each formula is evaluated once per entry, whatever the bookings
+            formulas.reset()
+            for b in bvalues:
+                b.fill(formulas)
+
+        return last-first
+
+
+# ---
+class FlowBooking(object):
+    '''
+    The histograms of a flow of nested cuts, filled in one pass.
+
+    Each entry is filled once, in the histogram of the deepest step it
+    passes. The histograms are summed from the deepest step upwards at the
+    end, therefore each step ends up with all the entries passing it.
+
+    hists:  one histogram per step
+    cuts:   the cuts still to be evaluated
+    offset: number of steps already passed by all the entries
+    '''
+    def __init__(self, hists, varexp, weight, cuts, offset=0):
+        if len(hists) != len(cuts)+offset:
+            raise ValueError('Expected %d histograms, found %d' % (len(cuts)+offset, len(hists)))
+
+        self.hists  = hists
+        self.vars   = splitvarexp(varexp)
+        self.weight = weight
+        self.cuts   = [str(c) for c in cuts]
+        self.offset = offset
+
+    # ---
+    def expressions(self):
+        return self.vars + self.cuts + ([self.weight] if self.weight else [])
+
+    # ---
+    def scalars(self):
+        return self.cuts + [self.weight]
+
+    # ---
+    def fill(self, formulas):
+        w = _evalweight(formulas, self.weight)
+        if w == 0.: return
+
+        depth = _depth(formulas, self.cuts, self.offset)
+        if depth == 0: return
+
+        _fillvars(self.hists[depth-1], formulas, self.vars, w)
+
+    # ---
+    def result(self, scale=1.):
+        for k in xrange(len(self.hists)-2,-1,-1):
+            self.hists[k].Add(self.hists[k+1])
+        for h in self.hists:
+            h.Scale(scale)
+        return self.hists
+
+
+# ---
+class FlowYieldBooking(object):
+    '''
+    The yields of a flow of nested cuts, filled in one pass (see FlowBooking)
+    '''
+    def __init__(self, weight, cuts, offset=0):
+        self.weight = weight
+        self.cuts   = [str(c) for c in cuts]
+        self.offset = offset
+        self.sumw   = [0.]*(len(cuts)+offset)
+        self.sumw2  = [0.]*(len(cuts)+offset)
+        self.n      = [0]*(len(cuts)+offset)
+
+    # ---
+    def expressions(self):
+        return self.cuts + ([self.weight] if self.weight else [])
+
+    # ---
+    def scalars(self):
+        return self.cuts + [self.weight]
+
+    # ---
+    def fill(self, formulas):
+        w = _evalweight(formulas, self.weight)
+        if w == 0.: return
+
+        depth = _depth(formulas, self.cuts, self.offset)
+        if depth == 0: return
+
+        self.sumw[depth-1]  += w
+        self.sumw2[depth-1] += w*w
+        self.n[depth-1]     += 1
+
+    # ---
+    def result(self, scale=1.):
+        # cumulative sums, from the deepest step
+        sumw  = numpy.cumsum(self.sumw[::-1])[::-1]
+        sumw2 = numpy.cumsum(self.sumw2[::-1])[::-1]
+        n     = numpy.cumsum(self.n[::-1])[::-1]
+        return YieldVector(sumw, sumw2, nentries=n).scale(scale)
+
+
+# ---
+class _Regions(object):
+    '''
+    The regions of a split selection, evaluated per entry.
+
+    Regions are either defined by a list of (possibly overlapping) cuts, or,
+    if category is given, by the values of a single categorization
+    expression, in which case the regions are mutually exclusive and only
+    category is evaluated.
+    '''
+    def __init__(self, regions, category=None):
+        self.category = category
+        if category:
+            self.cuts  = []
+            self.index = {}
+            for k,v in enumerate(regions):
+                self.index.setdefault(float(v),[]).append(k)
+        else:
+            self.cuts  = [str(r) for r in regions]
+            self.index = None
+
+    # ---
+    def expressions(self):
+        return [self.category] if self.category else self.cuts
+
+    # ---
+    def targets(self, formulas, w):
+        '''list of (region index, weight) for the current entry'''
+        if self.category:
+            if formulas.ndata(self.category) <= 0: return []
+            return [ (k,w) for k in self.index.get(formulas.value(self.category),[]) ]
+
+        targets = []
+        for k,c in enumerate(self.cuts):
+            v = formulas.value(c)
+            # as in TTree::Draw, the cut value multiplies the weight
+            if v != 0.: targets.append( (k,w*v) )
+        return targets
+
+
+# ---
+class RegionBooking(object):
+    '''
+    The histograms of a list of regions, filled in one pass (see _Regions)
+    '''
+    def __init__(self, hists, varexp, weight, regions, category=None):
+        if len(hists) != len(regions):
+            raise ValueError('Expected %d histograms, found %d' % (len(regions), len(hists)))
+
+        self.hists   = hists
+        self.vars    = splitvarexp(varexp)
+        self.weight  = weight
+        self.regions = _Regions(regions, category)
+
+    # ---
+    def expressions(self):
+        return self.vars + self.regions.expressions() + ([self.weight] if self.weight else [])
+
+    # ---
+    def scalars(self):
+        return self.regions.expressions() + [self.weight]
+
+    # ---
+    def fill(self, formulas):
+        w = _evalweight(formulas, self.weight)
+        if w == 0.: return
+
+        targets = self.regions.targets(formulas, w)
+        if not targets: return
+
+        for k,wk in targets:
+            _fillvars(self.hists[k], formulas, self.vars, wk)
+
+    # ---
+    def result(self, scale=1.):
+        for h in self.hists:
+            h.Scale(scale)
+        return self.hists
+
+
+# ---
+class RegionYieldBooking(object):
+    '''
+    The yields of a list of regions, filled in one pass (see _Regions)
+    '''
+    def __init__(self, weight, regions, category=None):
+        self.weight  = weight
+        self.regions = _Regions(regions, category)
+        self.sumw    = [0.]*len(regions)
+        self.sumw2   = [0.]*len(regions)
+        self.n       = [0]*len(regions)
+
+    # ---
+    def expressions(self):
+        return self.regions.expressions() + ([self.weight] if self.weight else [])
+
+    # ---
+    def scalars(self):
+        return self.regions.expressions() + [self.weight]
+
+    # ---
+    def fill(self, formulas):
+        w = _evalweight(formulas, self.weight)
+        if w == 0.: return
+
+        for k,wk in self.regions.targets(formulas, w):
+            self.sumw[k]  += wk
+            self.sumw2[k] += wk*wk
+            self.n[k]     += 1
+
+    # ---
+    def result(self, scale=1.):
+        return YieldVector(self.sumw, self.sumw2, nentries=self.n).scale(scale)
+
+
+# ---
+class VariationBooking(object):
+    '''
+    The histograms of a set of weight variations, filled in one pass.
+
+    Each variation has its own weight*cut expression; the variables are
+    evaluated once per entry and shared by all the variations.
+    '''
+    def __init__(self, hists, varexp, weights):
+        if len(hists) != len(weights):
+            raise ValueError('Expected %d histograms, found %d' % (len(weights), len(hists)))
+
+        self.hists   = hists
+        self.vars    = splitvarexp(varexp)
+        self.weights = weights
+
+    # ---
+    def expressions(self):
+        return self.vars + [w for w in self.weights if w]
+
+    # ---
+    def scalars(self):
+        return self.weights
+
+    # ---
+    def fill(self, formulas):
+        ws = [ _evalweight(formulas, w) for w in self.weights ]
+        if not any(ws): return
+
+        for i in xrange(_ninstances(formulas, self.vars)):
+            args = [_evalinstance(formulas,v,i) for v in self.vars]
+            for h,w in zip(self.hists,ws):
+                if w != 0.: h.Fill(*(args+[w]))
+
+    # ---
+    def result(self, scale=1.):
+        for h in self.hists:
+            h.Scale(scale)
+        return self.hists
+
+
+# ---
+class VariationYieldBooking(object):
+    '''
+    The yields of a set of weight variations, filled in one pass
+    '''
+    def __init__(self, weights):
+        self.weights = weights
+        self.sumw    = [0.]*len(weights)
+        self.sumw2   = [0.]*len(weights)
+        self.n       = [0]*len(weights)
+
+    # ---
+    def expressions(self):
+        return [w for w in self.weights if w]
+
+    # ---
+    def scalars(self):
+        return self.weights
+
+    # ---
+    def fill(self, formulas):
+        for k,e in enumerate(self.weights):
+            w = _evalweight(formulas, e)
+            if w == 0.: continue
+            self.sumw[k]  += w
+            self.sumw2[k] += w*w
+            self.n[k]     += 1
+
+    # ---
+    def result(self, scale=1.):
+        return YieldVector(self.sumw, self.sumw2, nentries=self.n).scale(scale)
+
+
+# ---
+class Range(object):
+    '''
+    The extent of the values taken by an expression: minimum, maximum and
+    number of values. If keep is set, the values themselves are stored as
+    well, for the quantiles.
+    '''
+    def __init__(self, keep=False):
+        self.min    = float('inf')
+        self.max    = float('-inf')
+        self.n      = 0
+        self.values = array.array('d') if keep else None
+
+    # ---
+    def __repr__(self):
+        return '%s(%g,%g,n=%d)' % (self.__class__.__name__,self.min,self.max,self.n)
+
+    # ---
+    def __nonzero__(self):
+        return self.n > 0
+
+    # ---
+    @staticmethod
+    def fromvalues(values, keep=False):
+        '''the range of a numpy array of values'''
+        r = Range(keep)
+        if len(values) == 0: return r
+        r.min,r.max = float(values.min()),float(values.max())
+        r.n = len(values)
+        if keep: r.values.fromstring(numpy.asarray(values,dtype=numpy.float64).tostring())
+        return r
+
+    # ---
+    def add(self, x):
+        if x < self.min: self.min = x
+        if x > self.max: self.max = x
+        self.n += 1
+        if self.values is not None: self.values.append(x)
+
+    # ---
+    def __add__(self, other):
+        r = Range(self.values is not None and other.values is not None)
+        r.min = min(self.min,other.min)
+        r.max = max(self.max,other.max)
+        r.n   = self.n+other.n
+        if r.values is not None:
+            r.values.extend(self.values)
+            r.values.extend(other.values)
+        return r
+
+    # ---
+    def quantiles(self, probs):
+        '''quantiles of the stored values, with linear interpolation'''
+        if self.values is None:
+            raise RuntimeError('Values not kept, quantiles not available')
+        if not self.n: return [float('nan')]*len(probs)
+
+        values = sorted(self.values)
+        qs = []
+        for p in probs:
+            x = p*(len(values)-1)
+            i = int(math.floor(x))
+            j = min(i+1,len(values)-1)
+            qs.append( values[i]+(values[j]-values[i])*(x-i) )
+        return qs
+
+
+# ---
+def autorange(xmin, xmax, nbins):
+    '''
+    Axis limits for nbins covering [xmin,xmax]: the upper edge is moved by a
+    fraction of a bin, such that xmax falls in the last bin rather than in
+    the overflow
+    '''
+    if xmin > xmax: return 0.,1.
+    if xmin == xmax: return xmin-1.,xmax+1.
+
+    return float(xmin),xmax+(xmax-xmin)/(1000.*nbins)
+
+
+# ---
+class RangeBooking(object):
+    '''
+    The ranges of a list of expressions over the selected entries, scanned
+    in one pass
+    '''
+    def __init__(self, exprs, weight='', keep=False):
+        self.exprs  = list(exprs)
+        self.weight = weight
+        self.ranges = [ Range(keep) for e in self.exprs ]
+
+    # ---
+    def expressions(self):
+        return self.exprs + ([self.weight] if self.weight else [])
+
+    # ---
+    def scalars(self):
+        return []
+
+    # ---
+    def fill(self, formulas):
+        if self.weight in formulas.multiple:
+            # the values of the instances passing the cut, as TTree::Draw
+            for e,r in zip(self.exprs,self.ranges):
+                for i in xrange(_ninstances(formulas, [e,self.weight])):
+                    if formulas.value(self.weight,i) != 0.:
+                        r.add(_evalinstance(formulas,e,i))
+            return
+
+        w = _evalweight(formulas, self.weight)
+        if w == 0.: return
+
+        for e,r in zip(self.exprs,self.ranges):
+            for i in xrange(formulas.ndata(e)):
+                r.add(formulas.value(e,i))
+
+    # ---
+    def result(self, scale=1.):
+        return self.ranges
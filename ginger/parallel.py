@@ -0,0 +1,81 @@
+import multiprocessing
+import logging
+
+# _____________________________________________________________________________
+#     ____                   ____     __
+#    / __ \____ __________ _/ / /__  / /
+#   / /_/ / __ `/ ___/ __ `/ / / _ \/ /
+#  / ____/ /_/ / /  / /_/ / / /  __/ /
+# /_/    \__,_/_/   \__,_/_/_/\___/_/
+#
+
+_log = logging.getLogger('parallel')
+
+
+# ---
+class WorkerSpec(object):
+    '''
+    Picklable recipe to rebuild a TreeWorker in a different process.
+
+    The worker selection is not stored: the entrylist shipped with each task
+    already accounts for it.
+    '''
+    def __init__(self, name, files, weight='', scale=1., friends=[], aliases={}, engine='draw', entries=None):
+        self.name    = name
+        self.files   = list(files)
+        self.weight  = weight
+        self.scale   = scale
+        self.friends = list(friends)
+        self.aliases = dict(aliases)
+        self.engine  = engine
+        self.entries = entries
+
+    # ---
+    def __repr__(self):
+        return '%s(%s,%d files,w=%r)' % (self.__class__.__name__,self.name,len(self.files),self.weight)
+
+    # ---
+    def build(self):
+        from .tree import TreeWorker
+
+        t = TreeWorker(self.name, self.files, weight=self.weight, friends=self.friends, entries=self.entries)
+        t.scale  = self.scale
+        t.engine = self.engine
+        for n,a in self.aliases.iteritems():
+            t.setalias(n,a)
+        return t
+
+
+# ---
+def _runtask(task):
+    '''
+    Executes a task in the child process
+    task = (spec, entrylist, method, args, kwargs)
+    '''
+    spec, elist, method, args, kwargs = task
+
+    worker = spec.build()
+    if elist: worker.SetEntryList(elist)
+
+    return getattr(worker, method)(*args, **kwargs)
+
+
+# ---
+def runtasks(tasks, processes):
+    '''
+    Runs the tasks on a pool of processes.
+    The results are returned in the same order as the tasks.
+    '''
+    if not tasks: return []
+
+    n = min(processes, len(tasks))
+    _log.debug('running %d tasks on %d processes', len(tasks), n)
+
+    pool = multiprocessing.Pool(n)
+    try:
+        results = pool.map(_runtask, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
@@ -1,2 +1,2 @@
 from directory import Directory
-from sentries import TH1AddDirSentry, TH1Sumw2Sentry, TStyleSentry
+from sentries import TH1AddDirSentry, TH1Sumw2Sentry, TTreeBranchSentry, TStyleSentry
@@ -35,6 +35,41 @@ class TH1Sumw2Sentry:
 # ------------------------------------------------------------------------------
 
 
+# ------------------------------------------------------------------------------
+class TTreeBranchSentry:
+    '''
+    Enables only the given branches of the trees (or chains), then restores
+    the previous branch statuses
+    '''
+    def __init__(self, trees, branches):
+        self.statuses = []
+        for t in trees:
+            blist = t.GetListOfBranches()
+            if not blist: continue
+
+            status = dict([ (b.GetName(),t.GetBranchStatus(b.GetName())) for b in blist ])
+            t.SetBranchStatus('*',0)
+            for b in branches:
+                if b in status: t.SetBranchStatus(b,1)
+            self.statuses.append( (t,status) )
+
+    def __del__(self):
+        for t,status in self.statuses:
+            if all(status.itervalues()):
+                t.SetBranchStatus('*',1)
+            else:
+                for n,s in status.iteritems():
+                    t.SetBranchStatus(n,s)
+        self.statuses = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.__del__()
+# ------------------------------------------------------------------------------
+
+
 # ------------------------------------------------------------------------------
 class TStyleSentry:
     def __init__(self, style):
@@ -6,6 +6,7 @@ import odict
 
 import ctypes
 import os.path
+import json
 import logging
 import math
 import uuid
@@ -16,6 +17,14 @@ import ROOT
 import copy
 from .base import Labelled
 from .core import AbsWorker, AbsView, Chained, Yield
+from .loop import splitvarexp, EventLoop, HistBooking, YieldBooking, FlowBooking, FlowYieldBooking, RegionBooking, RegionYieldBooking, VariationBooking, VariationYieldBooking, RangeBooking, Range
+from .parallel import WorkerSpec, runtasks
+from .cache import filestamp
+from . import fileindex
+from .columnar import ColumnarEngine, EntrySet, _tonumpy
+from .iopolicy import PrefetchSentry
+from .formula import compileexpr
+from .event import EventReader
 
 
 # _____________________________________________________________________________
@@ -75,9 +84,29 @@ def _bins2hclass( bins ):
     return ndim,hclass,hargs
 
 # _____________________________________________________________________________
-def _buildchain(treeName,files):
+def _buildchain(treeName,files,entries=None):
+    '''
+    entries: number of entries of each file, if known, else taken from the
+    file indexes (see fileindex) when available. The files are then not
+    opened to count them and the empty ones are left out.
+
+    Only the files without entries are skipped: the chain does not depend
+    on the cuts, files that a cut cannot reach are kept (the friends are
+    matched entry by entry, and the entrylists hold global entry numbers).
+    '''
+    if entries is None:
+        entries = fileindex.entrycounts(files,treeName)
+    if entries and len(entries) != len(files):
+        raise ValueError('Expected %d entry counts, found %d' % (len(files),len(entries)))
+
     tree = ROOT.TChain(treeName)
-    for path in files:
+    for i,path in enumerate(files):
+        if entries:
+            # no entries, nothing can be read from this file
+            if entries[i] == 0: continue
+            tree.Add(path,entries[i])
+            continue
+
         # if # is in the path, it's a zipfile!
         filepath = path if '#' not in path else path[:path.index('#')]
         if not os.path.exists(filepath):
@@ -112,13 +141,14 @@ class Sample(Labelled):
         self.files        = files
         self.preselection = preselection
         self.weight       = weight
+        self.scale        = scale
         self.friends      = friends
 
     #---
     def __repr__(self):
         repr = []
         repr += [self.__class__.__name__+(' '+self.name if self.name else'') + (' also known as '+self._title if self._title else '')]
-        repr += ['weight: \'%s\', preselection: \'%s\'' % (self.weight, self.preselection) ]
+        repr += ['weight: \'%s\', preselection: \'%s\', scale: %g' % (self.weight, self.preselection, self.scale) ]
         repr += ['name: '+self.name+'  files: '+str(self.files) ]
         for i,friend in enumerate(self.friends):
             repr += [('friend: ' if i == 0 else ' '*8)+friend[0]+'  files: '+str(friend[1]) ]
@@ -134,6 +164,22 @@ class Sample(Labelled):
     def addfriend(self, name, files):
         self.friends.append( (name, files) )
 
+    #---
+    @staticmethod
+    def fromsnapshot(path):
+        '''The sample of a file written by snapshot'''
+        f = ROOT.TFile.Open(path)
+        if not f or f.IsZombie():
+            raise RuntimeError('Failed to open %s' % path)
+        meta = f.Get('ginger')
+        if not meta:
+            raise ValueError('%s is not a snapshot' % path)
+        meta = json.loads(meta.GetTitle())
+        f.Close()
+
+        return Sample(str(meta['tree']), [path], weight=str(meta['weight']), scale=meta['scale'],
+                      friends=[ (str(n),[path]) for n in meta['friends'] ])
+
 
 # _____________________________________________________________________________
 #    ______             _       __           __
@@ -153,38 +199,61 @@ class TreeWorker(AbsWorker):
     t.selection = 'x < 1'
 
     t = TreeWorker.fromSample( sample )
+
+    A lazy worker builds its chain (opening the files) only when first
+    needed. entries, the number of entries of each file, spares the opening
+    of the files to count them.
     '''
     _log = logging.getLogger('TreeWorker')
     #---
 
     # ---
-    def __init__(self, name, files, selection='', weight='', friends=None):
-
-        self._chain = _buildchain(name, files)
-        # force the loading of the chains
-        self._chain.GetEntries()
+    def __init__(self, name, files, selection='', weight='', friends=None, lazy=False, entries=None):
 
+        self._tree      = name
+        self._files     = list(files)
+        self._nentries  = list(entries) if entries else None
+        self._chainobj  = None
         self._elist     = None
         self._friends   = []
+        self._ffiles    = []
+        # aliases set before the chain is built
+        self._aliases   = {}
+        self._booked    = odict.OrderedDict()
+        # on-disk cache of entrylists (EntryListCache)
+        self.entrycache = None
+        self._stamps    = None
+        self._columnar  = None
+        self.engine     = 'draw'
+        # enable only the branches used by each request
+        self.pruning    = True
+        # read cache configuration (IOPolicy)
+        self.iopolicy   = None
+        # views store their entries as EntrySets rather than TEntryLists
+        self.compact    = False
 
         self.weight    = weight
         self.selection = selection
         self.scale     = 1.
         if friends: self._link(friends)
 
+        if not lazy: self._load()
+
     # ---
     @staticmethod
-    def fromsample( sample ):
+    def fromsample( sample, lazy=False, entries=None ):
         if not isinstance( sample, Sample):
             raise ValueError('sample must inherit from %s (found %s)' % (Sample.__name__, sample.__class__.__name__) )
-        t = TreeWorker( sample.name, sample.files )
+        t = TreeWorker( sample.name, sample.files, friends=sample.friends, lazy=True, entries=entries )
         t.selection = sample.preselection
         t.weight    = sample.weight
+        t.scale     = sample.scale
+        if not lazy: t._load()
         return t
 
     #---
     def __repr__(self):
-        return '%s(%s,s=%r,w=%r)' % (self.__class__.__name__,self._chain.GetName(),self._selection,self._weight)
+        return '%s(%s,s=%r,w=%r)' % (self.__class__.__name__,self._tree,self._selection,self._weight)
 
     __str__ = __repr__
 
@@ -192,7 +261,7 @@ class TreeWorker(AbsWorker):
     #---
     def _link(self,friends):
         for ftree,ffilenames in friends:
-            self.addfriend(free,ffilenames)
+            self.addfriend(ftree,ffilenames)
 
     #---
     def __del__(self):
@@ -204,10 +273,78 @@ class TreeWorker(AbsWorker):
 
     #---
     def __getattr__(self,name):
+        # private attributes are never looked up in the chain
+        if name.startswith('_'): raise AttributeError(name)
         return getattr(self._chain,name)
 
     #---
-    def _makeentrylist(self,label,cut):
+    @property
+    def _chain(self):
+        if self._chainobj is None: self._load()
+        return self._chainobj
+
+    #---
+    @property
+    def loaded(self):
+        '''True once the chain has been built'''
+        return self._chainobj is not None
+
+    #---
+    def _load(self):
+        '''Builds the chain, then links the friends, sets the aliases and applies the selection'''
+        if self._chainobj is not None: return
+
+        self._log.debug('loading %s (%d files)', self._tree, len(self._files))
+        # the files opened from now on prefetch as the policy says
+        prefetch = PrefetchSentry(self.iopolicy.prefetch) if self.iopolicy else None
+        chain = _buildchain(self._tree, self._files, self._nentries)
+        # force the loading of the chains
+        chain.GetEntries()
+        self._chainobj = chain
+
+        # the aliases stored in the files (e.g. by snapshot) are not seen
+        # through the chain: copy them, the ones of the worker win
+        if chain.LoadTree(0) >= 0:
+            for a in (chain.GetTree().GetListOfAliases() or []):
+                if a.GetName() not in self._aliases: chain.SetAlias(a.GetName(),a.GetTitle())
+        for n,a in self._aliases.iteritems():
+            chain.SetAlias(n,a)
+        for n,files in self._ffiles:
+            self._linkfriend(n,files)
+        self._applyselection()
+
+    #---
+    def _filestamps(self):
+        '''size and mtime of the tree and friend files, taken once'''
+        if self._stamps is None:
+            files = self._files+[ f for n,fs in self._ffiles for f in fs ]
+            self._stamps = [ filestamp(f) for f in files ]
+        return self._stamps
+
+    #---
+    def _fingerprint(self):
+        '''Everything that determines the content of the worker's outputs'''
+        return (self._tree, self._filestamps(), self._selection, self._weight, self._scale, sorted(self.aliases().iteritems()))
+
+    #---
+    def _entrykey(self,expcut):
+        return self.entrycache.key(self._tree, self._filestamps(), self._selection, self._weight, self.aliases(), expcut)
+
+    #---
+    def _makeentrylist(self,label,cut,expcut=None):
+        '''
+        Makes the entrylist of the entries passing cut. expcut is the
+        cumulative cut the resulting list corresponds to, used to look the
+        list up in the entrycache.
+        '''
+
+        key = self._entrykey(expcut if expcut else cut) if self.entrycache else None
+        if key:
+            l = self.entrycache.get(key)
+            if l:
+                self._log.debug('entrylist for \'%s\' loaded from cache', expcut)
+                l.SetName(label)
+                return l
 
         cutexpr = self._cutexpr(cut)
         self._plot('>>'+label,cutexpr,'entrylist')
@@ -218,6 +355,82 @@ class TreeWorker(AbsWorker):
         # ensure the ownership
         ROOT.SetOwnership(l,True)
 
+        if key: self.entrycache.put(key,l)
+
+        return l
+
+    #---
+    def _entrynumbers(self,cut):
+        '''
+        The global entry numbers of the entries in the active entrylist
+        passing cut (non-null weight included), sorted. None if they
+        overflow the draw buffer (e.g. cuts on arrays).
+        '''
+        cutexpr = self._cutexpr(cut)
+        el = self._chain.GetEntryList()
+        total = el.GetN() if el.__nonzero__() else self._chain.GetEntries()
+
+        iosentries = self._ioguard([cutexpr])
+        estimate = self._chain.GetEstimate()
+        self._chain.SetEstimate(total+1)
+        try:
+            n = self._chain.Draw('Entry$', cutexpr, 'goff')
+            if n > total: return None
+            if n <= 0: return numpy.zeros(0, dtype=numpy.int64)
+
+            buf = self._chain.GetV1()
+            buf.SetSize(n)
+            entries = numpy.frombuffer(buf, dtype=numpy.float64, count=n).astype(numpy.int64)
+        finally:
+            self._chain.SetEstimate(estimate)
+
+        return numpy.unique(entries)
+
+    #---
+    def _makeentryset(self,cut):
+        '''Makes the EntrySet of the entries passing cut, None if not possible'''
+        entries = self._entrynumbers(cut)
+        return EntrySet(entries) if entries is not None else None
+
+    #---
+    def _treeoffsets(self):
+        '''The global entry number of the first entry of each tree of the chain, and the total'''
+        chain = self._chain
+        n = chain.GetNtrees()
+        buf = chain.GetTreeOffset()
+        buf.SetSize(n+1)
+        return numpy.frombuffer(buf, dtype=numpy.int64, count=n+1).copy()
+
+    #---
+    def _entrylistfrom(self,label,entries):
+        '''
+        Makes an entrylist from a sorted array of global entry numbers: the
+        entries are split by tree and each tree gets its sub-list of local
+        entry numbers, so the chain is not searched entry by entry
+        '''
+        l = ROOT.TEntryList(label,label)
+        l.SetDirectory(0x0)
+        ROOT.SetOwnership(l,True)
+
+        entries = numpy.asarray(entries, dtype=numpy.int64)
+        if not len(entries): return l
+
+        chain   = self._chain
+        offsets = self._treeoffsets()
+        bounds  = numpy.searchsorted(entries, offsets)
+        for i in xrange(len(offsets)-1):
+            lo,hi = bounds[i],bounds[i+1]
+            if lo == hi: continue
+
+            chain.LoadTree(int(offsets[i]))
+            sub = ROOT.TEntryList(label,label,chain.GetTree())
+            sub.SetDirectory(0x0)
+            ROOT.SetOwnership(sub,True)
+            enter = sub.Enter
+            for e in (entries[lo:hi]-offsets[i]).tolist():
+                enter(e)
+            l.Add(sub)
+
         return l
 
     #---
@@ -244,8 +457,15 @@ class TreeWorker(AbsWorker):
 #             self._log.debug( 'obj after  %s', l.__repr__())
 
     #---
-    def addfriend(name,files):
-        fchain = _buildchain(ftree,ffilenames)
+    def addfriend(self,name,files):
+        self._ffiles.append( (name, list(files)) )
+        self._stamps = None
+        # linked when the chain is built
+        if self._chainobj is not None: self._linkfriend(name,files)
+
+    #---
+    def _linkfriend(self,name,files):
+        fchain = _buildchain(name,files)
         if self._chain.GetEntriesFast() != fchain.GetEntries():
             raise RuntimeError('Mismatching number of entries: '
                                +self._chain.GetName()+'('+str(self._chain.GetEntriesFast())+'), '
@@ -253,6 +473,118 @@ class TreeWorker(AbsWorker):
         self._chain.AddFriend(fchain)
         self._friends.append(fchain)
 
+    #---
+    def _usedbranches(self, exprs):
+        '''
+        The branches read by the expressions, aliases expanded. None if any
+        of them can't be parsed or refers to something else than a branch of
+        the chain or of its friends.
+        '''
+        aliases  = self.aliases()
+        branches = set()
+        try:
+            for e in exprs:
+                if e and str(e).strip(): branches |= compileexpr(e,aliases).branches
+        except SyntaxError:
+            return None
+
+        # special variables (Entry$, ...)
+        branches = set([ b for b in branches if '$' not in b ])
+        for b in branches:
+            if not self._chain.GetBranch(b): return None
+
+        return branches
+
+    #---
+    def _ioguard(self, exprs):
+        '''
+        Prepares the chain and its friends for a loop over the expressions:
+        disables the branches not used (pruning) and configures the read
+        cache (iopolicy). The returned sentries restore the chain.
+        '''
+        if not (self.pruning or self.iopolicy): return []
+
+        trees    = [self._chain]+self._friends
+        branches = self._usedbranches(exprs)
+        sentries = []
+
+        if self.pruning and branches is not None:
+            self._log.debug('enabling %d branches: %s', len(branches), sorted(branches))
+            sentries.append( toolbox.TTreeBranchSentry(trees, branches) )
+
+        if self.iopolicy:
+            sentries.append( self.iopolicy.sentry(trees, branches) )
+
+        return sentries
+
+    #---
+    def snapshot(self, path, branches=None, lumi=1.):
+        '''
+        Writes the entries of the active entrylist to a new rootfile, with the
+        friends, and returns the Sample of it, with the worker weight, scale
+        and aliases. branches: the branches to keep, the ones used by the
+        weight are added; all if None. lumi: the part of the scale applied
+        by the analyser (TreeAnalyser.lumi), left out of the stored one.
+        '''
+        chain = self._chain
+        trees = [chain]+self._friends
+        scale = self._scale/lumi
+
+        if branches is not None:
+            keep = set(branches) | (self._usedbranches([self._weight]) or set())
+            brsentry = toolbox.TTreeBranchSentry(trees, keep)
+
+        elist = chain.GetEntryList()
+        n = elist.GetN() if elist else chain.GetEntries()
+
+        here = ROOT.gDirectory.func()
+        outfile = ROOT.TFile.Open(path,'recreate')
+        if not outfile or outfile.IsZombie():
+            raise RuntimeError('Failed to create %s' % path)
+
+        try:
+            # CopyTree honours the entrylist
+            out = chain.CopyTree('')
+            for a,expr in self.aliases().iteritems():
+                out.SetAlias(a,expr)
+            out.Write()
+
+            # friends don't share the entrylist: copy the entries one by one
+            friends = []
+            for i,(fchain,(fname,ffiles)) in enumerate(zip(self._friends,self._ffiles)):
+                fout = fchain.CloneTree(0)
+                # one name per tree in the file
+                if fname == self._tree or fname in friends:
+                    fname = '%s_friend%d' % (fname,i)
+                    fout.SetName(fname)
+                for i in xrange(n):
+                    fchain.GetEntry(chain.GetEntryNumber(i))
+                    fout.Fill()
+                fout.Write()
+                friends.append(fname)
+
+            meta = { 'tree': self._tree, 'weight': self._weight, 'scale': scale, 'friends': friends }
+            ROOT.TNamed('ginger',json.dumps(meta)).Write()
+        finally:
+            outfile.Close()
+            here.cd()
+
+        self._log.info('%d entries of %s written to %s', n, self._tree, path)
+        return Sample(self._tree, [path], weight=self._weight, scale=scale,
+                      friends=[ (f,[path]) for f in friends ])
+
+    #---
+    def _spec(self):
+        '''Picklable recipe to rebuild this worker in another process'''
+        return WorkerSpec(self._tree, self._files, self._weight,
+                          self._scale, self._ffiles, self.aliases(), self._engine, self._nentries)
+
+    #---
+    def _tasks(self, method, *args, **kwargs):
+        '''Describes the call as a list of tasks, running on the active entrylist'''
+        el = self._chain.GetEntryList()
+        return [( self._spec(), el if el.__nonzero__() else None, method, args, kwargs )]
+
     #---
     @property
     def scale(self):
@@ -263,6 +595,35 @@ class TreeWorker(AbsWorker):
     def scale(self,s):
         self._scale = float(s)
 
+    #---
+    @property
+    def engine(self):
+        return self._engine
+
+    #---
+    @engine.setter
+    def engine(self,e):
+        '''
+        draw:  TTree::Draw (default)
+        numpy: bulk read of the branches and evaluation on numpy arrays
+        '''
+        if e not in ['draw','numpy']:
+            raise ValueError('Unknown engine \'%s\'' % e)
+        self._engine = e
+
+    #---
+    @property
+    def columnar(self):
+        '''The columnar engine of this worker, whatever engine is in use'''
+        if not self._columnar:
+            self._columnar = ColumnarEngine(self)
+        return self._columnar
+
+    #---
+    def clearcache(self):
+        '''drops the selections cached by the columnar engine'''
+        if self._columnar: self._columnar.clearcache()
+
     #---
     @property
     def weight(self):    return self._weight
@@ -281,12 +642,17 @@ class TreeWorker(AbsWorker):
     def selection(self,c):
         # shall we work in a protected directory?
         self._selection = str(c)
+        # applied when the chain is built
+        if self._chainobj is not None: self._applyselection()
+
+    #---
+    def _applyselection(self):
         # make an entrylist with only the selected events
         name = 'selection'
 
         self._chain.SetEntryList(0x0)
 
-        if self._elist: del self._elist
+        self._elist = None
 
         #no selection, stop here
         if not self._selection: return
@@ -306,9 +672,9 @@ class TreeWorker(AbsWorker):
 
     #---
     def getminmax(self,var,binsize=0):
-        # check var is one of the branches, otherwise it doesn't work
-        import math
-        xmin,xmax = self._chain.GetMinimum(var),self._chain.GetMaximum(var)
+        # one pass for both, on the selected entries
+        r = self.scan([var])[var]
+        xmin,xmax = r.min,r.max
 
         if binsize > 0:
             xmin,xmax = math.floor(xmin/binsize)*binsize,math.ceil(xmax/binsize)*binsize
@@ -316,14 +682,89 @@ class TreeWorker(AbsWorker):
         return xmin,xmax
 
     #---
-    def entries(self,cut=None):
+    def scan(self, exprs, cut='', keep=False):
+        '''
+        Scans the ranges of a list of expressions in a single pass over the
+        selected entries. Returns a dictionary of loop.Range, keyed by
+        expression; keep the values to compute quantiles.
+        The pass is a single TTree::Draw, the minima and maxima are taken
+        from its buffers. To scan along with other bookings, in the same
+        event loop, use bookscan.
+        '''
+        if self._engine == 'numpy':
+            return self.columnar.scan(exprs, cut, keep)
+
+        cut = self._cutexpr(cut,addweight=False)
+        iosentries = self._ioguard( list(exprs)+[cut] )
+
+        varexp  = ':'.join(exprs)
+        options = 'goff para' if len(exprs) > 4 else 'goff'
+        n = self._chain.Draw(varexp, cut, options)
+        if n > self._chain.GetEstimate():
+            # the buffers keep the last entries only: make room for all
+            self._chain.SetEstimate(n+1)
+            n = self._chain.Draw(varexp, cut, options)
+        if n < 0:
+            raise ValueError('Failed to scan %s' % varexp)
+
+        ranges = [ Range.fromvalues(_tonumpy(self._chain.GetVal(i),n), keep) for i in xrange(len(exprs)) ]
+        return odict.OrderedDict(zip(exprs,ranges))
+
+    #---
+    def events(self, branches=None, blocksize=None):
+        '''
+        Python loop on the selected entries: one record per entry or, with
+        blocksize, numpy record arrays (see event.EventReader)
+        '''
+        reader = EventReader(self._chain, branches)
+        return reader.blocks(blocksize) if blocksize else reader.events()
+
+    #---
+    def _ranges(self, workers):
+        '''
+        Splits the active entrylist (or the whole chain) in contiguous ranges
+        of (first, nentries)
+        '''
+        el = self._chain.GetEntryList()
+        total = el.GetN() if el.__nonzero__() else self._chain.GetEntries()
+        if total <= 0: return []
+
+        step = int(math.ceil(float(total)/workers))
+        return [ (first, min(step,total-first)) for first in xrange(0,total,step) ]
+
+    #---
+    def _sharded(self, workers, method, *args):
+        '''
+        Runs method on workers processes, each on a range of entries. The range
+        is appended to args as (nentries, firstentry), as TTree::Draw wants it.
+        Returns the list of partial results, ordered by range.
+        '''
+        # the columnar engine reads the whole entrylist: no ranges
+        if self._engine == 'numpy' and method != '_entries':
+            raise ValueError('%s with workers > 1 is not supported by the numpy engine, use the draw engine' % method)
+
+        spec, elist, method, args, kwargs = self._tasks(method, *args)[0]
+        tasks = [ (spec, elist, method, args+(n,first), kwargs) for first,n in self._ranges(workers) ]
+
+        return runtasks(tasks, workers)
+
+    #---
+    def entries(self,cut=None,workers=0):
         if not cut:
             el = self._chain.GetEntryList()
             if el.__nonzero__(): return el.GetN()
             else:                return self._chain.GetEntries()
+        elif workers > 1:
+            return sum(self._sharded(workers, '_entries', cut))
+        elif self._engine == 'numpy':
+            return self.columnar.entries(cut)
         else:
-            # super simple projection
-            return self._chain.Draw('1.', cut,'goff')
+            return self._entries(cut)
+
+    #---
+    def _entries(self, cut, *args):
+        # super simple projection
+        return self._chain.Draw('1.', cut,'goff', *args)
 
     #---
     def rawdraw(self, *args):
@@ -332,21 +773,25 @@ class TreeWorker(AbsWorker):
 
     #---
     def setalias(self,name,alias):
+        self._aliases[name] = alias
+        if self._chainobj is None: return True
         return self._chain.SetAlias(name,alias)
 
     #---
     def aliases(self):
+        if self._chainobj is None: return dict(self._aliases)
         return dict([ (n.GetName(),n.GetTitle()) for n in self._chain.GetListOfAliases()])
 
     #--
-    def _cutexpr(self,cuts,addweight=True,addselection=False):
+    def _cutexpr(self,cuts,addweight=True,addselection=False,weight=None):
         '''
         makes a cut string or a list of cuts into the cutsrting to be used with
-        the TTree, adding the weight
+        the TTree, adding the weight (or the alternative weight, if given)
         '''
 
+        if weight is None: weight = self._weight
         # ignore unitary weights
-        w = self._weight if addweight and self._weight != '1' else None
+        w = weight if addweight and str(weight) != '1' else None
         # add selection only if requested
         s = self._selection if addselection else None
 
@@ -357,6 +802,17 @@ class TreeWorker(AbsWorker):
 
         return expr
 
+    #---
+    @staticmethod
+    def _fixedbins( bins ):
+        '''
+        True if the binning is fully specified, i.e. _projexpr makes the
+        histogram rather than leaving it to TTree::Draw
+        '''
+        if not isinstance(bins, tuple): return False
+        l = len(bins)
+        return (l in [1,2] and all(map(lambda o: isinstance(o,list),bins))) or (l in [3,6])
+
     #---
     @staticmethod
     def _projexpr( name, bins = None ):
@@ -373,7 +829,7 @@ class TreeWorker(AbsWorker):
         l = len(bins)
         # if the tuple is made of lists
 #         if l in [1,2] and all(map(lambda o: isinstance(o,list),bins)):
-        if (l in [1,2] and all(map(lambda o: isinstance(o,list),bins))) or (l in [3,6]):
+        if TreeWorker._fixedbins(bins):
             dirsentry = toolbox.TH1AddDirSentry()
             sumsentry = toolbox.TH1Sumw2Sentry()
 
@@ -416,6 +872,8 @@ class TreeWorker(AbsWorker):
         dirsentry = toolbox.TH1AddDirSentry()
         sumsentry = toolbox.TH1Sumw2Sentry()
         options = 'goff '+options
+        # strip the target, if any
+        iosentries = self._ioguard( splitvarexp(varexp.split('>>')[0])+[cut] )
         self._log.debug('varexp:  \'%s\'', varexp)
         self._log.debug('cut:     \'%s\'', cut)
         self._log.debug('options: \'%s\'', options)
@@ -434,6 +892,16 @@ class TreeWorker(AbsWorker):
 
     #---
     def yields(self, cut='', options='', *args, **kwargs):
+        workers = kwargs.pop('workers',0)
+        if workers > 1:
+            if args: raise ValueError('Entry ranges can\'t be used with workers')
+            parts = self._sharded(workers, 'yields', cut, options)
+            return sum(parts[1:], parts[0]) if parts else Yield(0.,0.)
+
+        if self._engine == 'numpy':
+            if args: raise ValueError('Entry ranges not supported by the numpy engine')
+            return self.columnar.yields(cut)
+
         cut = self._cutexpr(cut)
         # DO add the histogram, and set sumw2 (why not using TH1::Sumw2()?
         dirsentry = toolbox.TH1AddDirSentry(True)
@@ -444,11 +912,16 @@ class TreeWorker(AbsWorker):
         counter = ROOT.TH1D(tname,tname,1,0.,1.)
         h = self._plot('0. >> '+tname, cut, options, *args, **kwargs)
 
+        # all the entries are in the first bin: take the sums as they are
+        sumw2 = h.GetSumw2()
+        if sumw2.GetSize() > 1:
+            return Yield.fromsums(h.GetBinContent(1), sumw2.At(1), int(h.GetEntries()))
+
         xax = h.GetXaxis()
         err = ctypes.c_double(0.)
-        int = h.IntegralAndError(xax.GetFirst(), xax.GetLast(), err)
+        value = h.IntegralAndError(xax.GetFirst(), xax.GetLast(), err)
 
-        return Yield(int,err.value)
+        return Yield(value,err.value,int(h.GetEntries()))
 
     #---
     def plot(self, name, varexp, cut='', options='', bins=None, *args, **kwargs):
@@ -459,6 +932,22 @@ class TreeWorker(AbsWorker):
 
         ndim,hstr,htemp = self._projexpr(name,bins)
 
+        workers = kwargs.pop('workers',0)
+        if workers > 1:
+            if args: raise ValueError('Entry ranges can\'t be used with workers')
+            # the partial histograms must share the binning
+            if not htemp: raise ValueError('Automatic binning not supported with workers')
+
+            parts = self._sharded(workers, 'plot', name, varexp, cut, options, bins)
+            if parts:
+                for hx in parts[1:]:
+                    parts[0].Add(hx)
+                return parts[0]
+
+        if self._engine == 'numpy':
+            if args: raise ValueError('Entry ranges not supported by the numpy engine')
+            return self.columnar.plot(name, varexp, cut, bins)
+
         cut = self._cutexpr(cut)
 
         if htemp:
@@ -483,6 +972,141 @@ class TreeWorker(AbsWorker):
 
         return h
 
+    #---
+    def _bookinghist(self, name, varexp, bins):
+        '''
+        Prepares a histogram for the EventLoop. Unlike plot, the binning must
+        be fully specified.
+        '''
+        m = re.match(r'.*(\([^\)]*\))',name)
+        if m: raise ValueError('Use bins argument to specify the binning %s' % m.group(1))
+
+        ndim,hstr,htemp = self._projexpr(name,bins)
+        if not htemp:
+            raise ValueError('Automatic binning not supported by book (yet)')
+
+        htemp.SetDirectory(0x0)
+        htemp.SetXTitle(varexp)
+
+        return htemp
+
+    #---
+    def _makebooking(self, name, varexp, bins, cut=''):
+        return HistBooking(self._bookinghist(name, varexp, bins), varexp, self._cutexpr(cut))
+
+    #---
+    def _makeflowbooking(self, name, varexp, bins, cuts, cut='', offset=0):
+        hists = [ self._bookinghist('%s_%d' % (name,i), varexp, bins) for i in xrange(len(cuts)+offset) ]
+        return FlowBooking(hists, varexp, self._cutexpr(cut), cuts, offset)
+
+    #---
+    def _makeregionbooking(self, name, varexp, bins, regions, cut='', category=None):
+        hists = [ self._bookinghist('%s_%d' % (name,i), varexp, bins) for i in xrange(len(regions)) ]
+        return RegionBooking(hists, varexp, self._cutexpr(cut), regions, category)
+
+    #---
+    def _variationexprs(self, variations, cut=''):
+        '''
+        The weight*cut expression of each variation. A variation is either an
+        alternative weight or a (weight, cut) pair overriding cut as well. A
+        None weight stands for the worker weight.
+        '''
+        exprs = []
+        for v in variations:
+            w,c = v if isinstance(v,tuple) else (v,cut)
+            exprs.append(self._cutexpr(c,weight=w))
+        return exprs
+
+    #---
+    def _makevariationbooking(self, name, varexp, bins, variations, cut=''):
+        hists = [ self._bookinghist('%s_%d' % (name,i), varexp, bins) for i in xrange(len(variations)) ]
+        return VariationBooking(hists, varexp, self._variationexprs(variations, cut))
+
+    #---
+    def _arrayexprs(self, exprs):
+        '''the expressions with multiple instances per entry (see EventLoop)'''
+        return EventLoop(self._chain).multiple(exprs)
+
+    #---
+    def _run(self, bookings, first=0, nentries=None):
+        iosentries = self._ioguard([ e for b in bookings.itervalues() for e in b.expressions() ])
+        # the cache efficiency of each file, before the chain leaves it
+        collect = [ s.collect for s in iosentries if hasattr(s,'collect') ]
+        loop = EventLoop(self._chain, collect[0] if collect else None)
+        loop.run(bookings, first, nentries)
+
+        return odict.OrderedDict(
+            [( n,b.result(self._scale) ) for n,b in bookings.iteritems()]
+        )
+
+    #---
+    def book(self, name, varexp, bins, cut=''):
+        '''Book a histogram, to be filled at the next run()'''
+        self._booked[name] = self._makebooking(name, varexp, bins, cut)
+
+    #---
+    def bookyields(self, name, cut=''):
+        '''Book a yield, to be filled at the next run()'''
+        self._booked[name] = YieldBooking(self._cutexpr(cut))
+
+    #---
+    def bookflow(self, name, varexp, bins, cuts, cut='', offset=0):
+        '''
+        Book the histograms of a flow of nested cuts, to be filled at the next
+        run(), which returns them as a list (one per step). offset is the
+        number of steps the active entrylist already passes.
+        '''
+        self._booked[name] = self._makeflowbooking(name, varexp, bins, cuts, cut, offset)
+
+    #---
+    def bookyieldsflow(self, name, cuts, cut='', offset=0):
+        '''Book the yields of a flow of nested cuts (see bookflow)'''
+        self._booked[name] = FlowYieldBooking(self._cutexpr(cut), cuts, offset)
+
+    #---
+    def bookregions(self, name, varexp, bins, regions, cut='', category=None):
+        '''
+        Book one histogram per region, to be filled at the next run(), which
+        returns them as a list. Regions are a list of cuts or, if category is
+        given, of values of the category expression (exclusive regions,
+        only category is evaluated per entry).
+        '''
+        self._booked[name] = self._makeregionbooking(name, varexp, bins, regions, cut, category)
+
+    #---
+    def bookyieldsregions(self, name, regions, cut='', category=None):
+        '''Book the yields of a list of regions (see bookregions)'''
+        self._booked[name] = RegionYieldBooking(self._cutexpr(cut), regions, category)
+
+    #---
+    def bookvariations(self, name, varexp, bins, variations, cut=''):
+        '''
+        Book one histogram per weight variation, to be filled at the next
+        run(), which returns them as a list (see _variationexprs).
+        Note that the active entrylist was built with the worker weight:
+        entries with a null nominal weight are not considered.
+        '''
+        self._booked[name] = self._makevariationbooking(name, varexp, bins, variations, cut)
+
+    #---
+    def bookyieldsvariations(self, name, variations, cut=''):
+        '''Book the yields of a list of weight variations (see bookvariations)'''
+        self._booked[name] = VariationYieldBooking(self._variationexprs(variations, cut))
+
+    #---
+    def bookscan(self, name, exprs, cut='', keep=False):
+        '''Book the ranges of a list of expressions, returned as a list (see scan)'''
+        self._booked[name] = RangeBooking(exprs, self._cutexpr(cut,addweight=False), keep)
+
+    #---
+    def run(self):
+        '''
+        Fills all the booked histograms and yields with a single pass over the
+        tree and returns them keyed by name. The bookings are then cleared.
+        '''
+        bookings, self._booked = self._booked, odict.OrderedDict()
+        return self._run(bookings)
+
     #---
     def yieldsflow(self, cuts, options=''):
         '''Does it make sense to have a double step?  In a way yes, because
@@ -550,6 +1174,7 @@ class ChainWorker(Chained,AbsWorker):
         '''  '''
         super(ChainWorker,self).__init__(AbsWorker,*workers)
         self._scale = 1.
+        self._entrycache = None
 
     #---
     @property
@@ -567,6 +1192,74 @@ class ChainWorker(Chained,AbsWorker):
 
         self._scale = float(s)
 
+    #---
+    @property
+    def entrycache(self):
+        return self._entrycache
+
+    #---
+    @entrycache.setter
+    def entrycache(self,cache):
+        for o in self._objs:
+            o.entrycache = cache
+
+        self._entrycache = cache
+
+    #---
+    @property
+    def engine(self):
+        return self._objs[0].engine if self._objs else None
+
+    #---
+    @engine.setter
+    def engine(self,e):
+        for o in self._objs:
+            o.engine = e
+
+    #---
+    @property
+    def iopolicy(self):
+        return self._objs[0].iopolicy if self._objs else None
+
+    #---
+    @iopolicy.setter
+    def iopolicy(self,policy):
+        '''the policy (and its stats) is shared by the members'''
+        for o in self._objs:
+            o.iopolicy = policy
+
+    #---
+    @property
+    def pruning(self):
+        return all([ o.pruning for o in self._objs ])
+
+    #---
+    @pruning.setter
+    def pruning(self,p):
+        for o in self._objs:
+            o.pruning = p
+
+    #---
+    def clearcache(self):
+        for o in self._objs:
+            o.clearcache()
+
+    #---
+    def _arrayexprs(self, exprs):
+        # the members share the same tree structure
+        return self._objs[0]._arrayexprs(exprs) if self._objs else []
+
+    #---
+    @property
+    def compact(self):
+        return all([ o.compact for o in self._objs ])
+
+    #---
+    @compact.setter
+    def compact(self,c):
+        for o in self._objs:
+            o.compact = c
+
     #---
     def spawnview(self, cut='', name=None):
         return ChainView(self,cut,name)
@@ -599,10 +1292,15 @@ class ChainWorker(Chained,AbsWorker):
         return chainviews
 
     @staticmethod
-    def fromsamples( *samples ):
-        ''' build each sample into a TreeWorker and add them together'''
+    def fromsamples( *samples, **kwargs ):
+        '''
+        build each sample into a TreeWorker and add them together
+        lazy: defer the building of the chains to their first use
+        '''
+        lazy = kwargs.pop('lazy',False)
+        if kwargs: raise TypeError('Unexpected arguments %s' % kwargs.keys())
 
-        trees = [TreeWorker.fromsample(s) for s in samples]
+        trees = [TreeWorker.fromsample(s,lazy) for s in samples]
         return ChainWorker(*trees)
 
 
@@ -619,13 +1317,21 @@ class ChainWorker(Chained,AbsWorker):
 class TreeView(AbsView):
     '''
     A Class to create iews (via TEntryList) on a TreeWorker
+
+    The entries of the view are held in a TEntryList or, if the worker is
+    compact, in an EntrySet converted to a TEntryList only when needed. Both
+    are never modified once made, and shared by the copies of the view.
     '''
     class Sentry:
         '''
-        A class to insert and clean an entrylist from a worker when needed
+        A class to insert and clean an entrylist from a worker when needed.
+        The entrylist made for an EntrySet (index) is released on exit.
         '''
-        def __init__(self,worker,elist):
+        def __init__(self,worker,elist,index=None):
             self._worker = worker
+            # held until the chain lets it go
+            self._elist  = elist
+            self._index  = index
 
             current = self._worker.GetEntryList()
 
@@ -635,19 +1341,26 @@ class TreeView(AbsView):
         def __del__(self):
             # reset the old configuration
             self._worker.SetEntryList(self._oldlist)
+            if self._index is not None: self._index.release()
 
     _log = logging.getLogger('TreeView')
 
     # ---
-    def __init__(self, worker=None, cut='', name=None):
+    def __init__(self, worker=None, cut='', name=None, expcut=None):
 
         if worker and not isinstance(worker,TreeWorker):
             raise TypeError('worker must ve of class TreeWorker')
 
         self._worker = worker
         self._cut    = cut
-        self._expcut = cut
+        self._expcut = expcut if expcut else cut
         self._elist  = None
+        # selection held as an EntrySet (compact workers)
+        self._index  = None
+        self._booked = odict.OrderedDict()
+        # selection held as a cut mask (CutMasks, step)
+        self._masks  = None
+        self._step   = None
 
         # don't build the list if no worker (used by copy)
         if not worker: return
@@ -655,10 +1368,12 @@ class TreeView(AbsView):
 
         # make myself a name if I don't have one
         self._name = name if name else str(uuid.uuid1())
-        if cut:
-            self._elist = self._worker._makeentrylist(self._name,cut)
-        elif self._worker._elist:
-            self._elist = self._worker._elist.Clone()
+        if cut and self._worker.compact:
+            self._index = self._worker._makeentryset(cut)
+        if cut and self._index is None:
+            self._elist = self._worker._makeentrylist(self._name,cut,self._expcut)
+        elif not cut and self._worker._elist:
+            self._elist = self._worker._elist
             self._name  = self._elist.GetName()
 
     #---
@@ -667,7 +1382,12 @@ class TreeView(AbsView):
         other._cut        = copy.deepcopy(self._cut)
         other._expcut     = copy.deepcopy(self._expcut)
         other._worker     = self._worker
-        other._elist      = self._elist.Clone() if self._elist else None
+        other._name       = self._name
+        # never modified once made: shared, not cloned
+        other._elist      = self._elist
+        other._index      = self._index
+        other._masks      = self._masks
+        other._step       = self._step
 
 #         assert(0)
         return other
@@ -690,17 +1410,41 @@ class TreeView(AbsView):
 
     # ---
     def _sentry(self):
+        # views built from masks make their entrylist only when needed
+        if self._index is None and self._masks:
+            self._index = self._masks.entryset(self._step)
+
+        elist = self._index.entrylist(self._worker,self._name) if self._index is not None else self._elist
+
         # make a sentry which sets the current entrlylist in the worker and removes it when going out of scope
-        return TreeView.Sentry(self._worker,self._elist)
+        return TreeView.Sentry(self._worker,elist,self._index)
+
+    # ---
+    def release(self):
+        '''drops the TEntryList made for the EntrySet, if any'''
+        if self._index is not None: self._index.release()
 
     # ---
-    def entries(self,cut=None):
+    def _usemasks(self):
+        # the masks are valid as long as the weight doesn't change
+        return self._masks is not None and self._masks.weight == self._worker.weight
+
+    # ---
+    def entries(self,cut=None,workers=0):
+        if not cut and self._index is not None:
+            return len(self._index)
+        if not cut and self._masks:
+            return self._masks.count(self._step)
+
         # get the entries from worker after setting the entrylist
         sentry = self._sentry()
-        return self._worker.entries(cut)
+        return self._worker.entries(cut,workers)
 
     # ---
     def yields(self, cut='', options='', *args, **kwargs):
+        if not (cut or options or args or kwargs) and self._usemasks():
+            return self._masks.yields(self._step,self._worker.scale)
+
         # set temporarily my entrlylist
         sentry = self._sentry()
         return self._worker.yields(cut, options, *args, **kwargs)
@@ -711,6 +1455,25 @@ class TreeView(AbsView):
         sentry = self._sentry()
         return self._worker.plot(name, varexp, cut, options, bins, *args, **kwargs)
 
+    # ---
+    def scan(self, exprs, cut='', keep=False):
+        # set temporarily my entrlylist
+        sentry = self._sentry()
+        return self._worker.scan(exprs, cut, keep)
+
+    # ---
+    def events(self, branches=None, blocksize=None):
+        # my entrylist is set for the whole loop
+        sentry = self._sentry()
+        for e in self._worker.events(branches, blocksize):
+            yield e
+
+    # ---
+    def snapshot(self, path, branches=None, lumi=1.):
+        '''Writes the entries of the view to a new rootfile (see TreeWorker.snapshot)'''
+        sentry = self._sentry()
+        return self._worker.snapshot(path, branches, lumi)
+
     # ---
     def project(self, h, varexp, cut='', options='', *args, **kwargs):
         # set temporarily my entrlylist
@@ -722,6 +1485,54 @@ class TreeView(AbsView):
         sentry = self._sentry()
         return self._worker.rawdraw(*args)
 
+    # ---
+    def _tasks(self, method, *args, **kwargs):
+        sentry = self._sentry()
+        return self._worker._tasks(method, *args, **kwargs)
+
+    # ---
+    def book(self, name, varexp, bins, cut=''):
+        self._booked[name] = self._worker._makebooking(name, varexp, bins, cut)
+
+    # ---
+    def bookyields(self, name, cut=''):
+        self._booked[name] = YieldBooking(self._worker._cutexpr(cut))
+
+    # ---
+    def bookflow(self, name, varexp, bins, cuts, cut='', offset=0):
+        self._booked[name] = self._worker._makeflowbooking(name, varexp, bins, cuts, cut, offset)
+
+    # ---
+    def bookyieldsflow(self, name, cuts, cut='', offset=0):
+        self._booked[name] = FlowYieldBooking(self._worker._cutexpr(cut), cuts, offset)
+
+    # ---
+    def bookregions(self, name, varexp, bins, regions, cut='', category=None):
+        self._booked[name] = self._worker._makeregionbooking(name, varexp, bins, regions, cut, category)
+
+    # ---
+    def bookyieldsregions(self, name, regions, cut='', category=None):
+        self._booked[name] = RegionYieldBooking(self._worker._cutexpr(cut), regions, category)
+
+    # ---
+    def bookvariations(self, name, varexp, bins, variations, cut=''):
+        self._booked[name] = self._worker._makevariationbooking(name, varexp, bins, variations, cut)
+
+    # ---
+    def bookyieldsvariations(self, name, variations, cut=''):
+        self._booked[name] = VariationYieldBooking(self._worker._variationexprs(variations, cut))
+
+    # ---
+    def bookscan(self, name, exprs, cut='', keep=False):
+        self._booked[name] = RangeBooking(exprs, self._worker._cutexpr(cut,addweight=False), keep)
+
+    # ---
+    def run(self):
+        # set temporarily my entrlylist
+        sentry = self._sentry()
+        bookings, self._booked = self._booked, odict.OrderedDict()
+        return self._worker._run(bookings)
+
 
     # ---
     def spawn(self,cut,name=None):
@@ -730,11 +1541,150 @@ class TreeView(AbsView):
         # set temporarily my entrlylist
         sentry = self._sentry()
         # create my spawn
-        v = TreeView(self._worker, cut, name=name)
+        expcut = '(%s) && (%s)' % (self._expcut,cut) if self._expcut else cut
+        v = TreeView(self._worker, cut, name=name, expcut=expcut)
+
+        return v
+
+    # ---
+    def spawnflow(self,cuts,names):
+        '''
+        Spawns a chain of views, one per cut, each selecting the entries of the
+        previous passing its cut. The selections are evaluated on a single
+        read of the data and kept as masks.
+        '''
+        # set temporarily my entrlylist
+        sentry = self._sentry()
+        masks = self._worker.columnar.cutmasks(cuts, base=self._expcut)
+
+        views  = []
+        expcut = self._expcut
+        for i,(cut,name) in enumerate(zip(cuts,names)):
+            expcut = '(%s) && (%s)' % (expcut,cut) if expcut else cut
+
+            v = TreeView()
+            v._worker = self._worker
+            v._cut    = cut
+            v._expcut = expcut
+            v._name   = name
+            v._masks  = masks
+            v._step   = i
+            views.append(v)
+
+        return views
+
+    # ---
+    def _adoptselection(self):
+        '''
+        A view without cut holds the worker selection, which a lazy worker
+        makes only when its chain is loaded: load it and take the selection
+        if the view was made before
+        '''
+        if self._cut or self._elist is not None or self._index is not None or self._masks: return
+
+        self._worker._load()
+        if self._worker._elist:
+            self._elist = self._worker._elist
+            self._name  = self._elist.GetName()
+
+    # ---
+    def _entryset(self):
+        '''the EntrySet of the view, None if the entries are held in a TEntryList'''
+        self._adoptselection()
+        if self._index is None and self._masks:
+            self._index = self._masks.entryset(self._step)
+        if self._index is not None:
+            return self._index
+        if self._elist is not None:
+            return None
+        # no selection: all the entries of the chain
+        return EntrySet(numpy.arange(self._worker.GetEntries()))
+
+    # ---
+    def _unselected(self):
+        '''True if the view has no selection: all the entries of the chain'''
+        self._adoptselection()
+        return self._index is None and self._elist is None and not self._masks
+
+    # ---
+    def _combine(self, other, op):
+        '''
+        Combines the selections of two views of the same worker: union (|),
+        intersection (&) or difference (-). The result is computed on the
+        entry numbers or the entrylists, without reading the data.
+        '''
+        if not isinstance(other,TreeView): return NotImplemented
+        if other._worker is not self._worker:
+            raise ValueError('Views of different workers can\'t be combined')
+
+        # all the entries: no need to list them
+        ua,ub = self._unselected(),other._unselected()
+        if op == '|' and (ua or ub):
+            return copy.copy(self if ua else other)
+        if op == '&' and (ua or ub):
+            return copy.copy(other if ua else self)
+
+        a,b = (self._expcut or '1'),(other._expcut or '1')
+        expcut = {
+            '|': '(%s) || (%s)' % (a,b),
+            '&': '(%s) && (%s)' % (a,b),
+            '-': '(%s) && !(%s)' % (a,b),
+        }[op]
+
+        v = TreeView()
+        v._worker = self._worker
+        v._cut    = expcut
+        v._expcut = expcut
+        v._name   = str(uuid.uuid1())
+
+        if op == '-' and ub:
+            v._index = EntrySet(numpy.zeros(0, dtype=numpy.int64))
+            return v
+
+        sa,sb = self._entryset(),other._entryset()
+        if sa is not None and sb is not None:
+            combine = { '|': numpy.union1d, '&': numpy.intersect1d, '-': numpy.setdiff1d }[op]
+            v._index = EntrySet(combine(sa.entries,sb.entries))
+            return v
+
+        # at least one entrylist: use the TEntryList operations
+        la = sa.entrylist(self._worker,self._name) if sa is not None else self._elist
+        lb = sb.entrylist(other._worker,other._name) if sb is not None else other._elist
+
+        l = la.Clone(v._name)
+        ROOT.SetOwnership(l,True)
+        l.SetDirectory(0x0)
+        if op == '|':
+            l.Add(lb)
+        elif op == '-':
+            l.Subtract(lb)
+        else:
+            # a & b = a - (a - b)
+            d = la.Clone()
+            ROOT.SetOwnership(d,True)
+            d.SetDirectory(0x0)
+            d.Subtract(lb)
+            l.Subtract(d)
+        v._elist = l
+
+        # the lists made for the entry sets are not needed anymore
+        for es in (sa,sb):
+            if es is not None: es.release()
 
-        v._expcut = '(%s) && (%s)' % (self._expcut,cut) if self._expcut else cut
         return v
 
+    # ---
+    def __or__(self, other):
+        return self._combine(other,'|')
+
+    # ---
+    def __and__(self, other):
+        return self._combine(other,'&')
+
+    # ---
+    def __sub__(self, other):
+        return self._combine(other,'-')
+
 #_______________________________________________________________________________
 #    ________          _     _    ___
 #   / ____/ /_  ____ _(_)___| |  / (_)__ _      __
@@ -763,6 +1713,7 @@ class ChainView(Chained,AbsView):
 
         views = [t.spawnview(cut,name) for t in worker]
         self.add(*views)
+        self.processes = worker.processes
 
     # ---
     @property
@@ -779,6 +1730,7 @@ class ChainView(Chained,AbsView):
         objs  = copy.deepcopy(self._objs)
         other = ChainView()
         other.add(*objs)
+        other.processes = self.processes
         return other
 
     def __deepcopy__(self,memo):
@@ -792,5 +1744,61 @@ class ChainView(Chained,AbsView):
         views = [ o.spawn(*args, **kwargs) for o in self._objs]
 
         child.add(*views)
+        child.processes = self.processes
 
         return child
+
+    # ---
+    def spawnflow(self,cuts,names):
+        # one list of views per member, repacked by cut
+        allviews = [ o.spawnflow(cuts,names) for o in self._objs ]
+
+        children = []
+        for views in zip(*allviews):
+            child = ChainView()
+            child.add(*views)
+            child.processes = self.processes
+            children.append(child)
+
+        return children
+
+    # ---
+    def _combine(self, other, op):
+        '''combines the member views one by one (see TreeView._combine)'''
+        if not isinstance(other,ChainView): return NotImplemented
+        if len(self._objs) != len(other._objs):
+            raise ValueError('Views with different members can\'t be combined')
+
+        child = ChainView()
+        child.add(*[ a._combine(b,op) for a,b in zip(self._objs,other._objs) ])
+        child.processes = self.processes
+
+        return child
+
+    # ---
+    def __or__(self, other):
+        return self._combine(other,'|')
+
+    # ---
+    def __and__(self, other):
+        return self._combine(other,'&')
+
+    # ---
+    def __sub__(self, other):
+        return self._combine(other,'-')
+
+    # ---
+    def release(self):
+        for o in self._objs:
+            o.release()
+
+    # ---
+    def snapshot(self, directory, branches=None, lumi=1.):
+        '''
+        Writes the entries of each member view to its own rootfile in
+        directory and returns the list of Samples (see TreeWorker.snapshot)
+        '''
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        return [ v.snapshot(os.path.join(directory,'snapshot_%d.root' % i), branches, lumi) for i,v in enumerate(self._objs) ]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+# Compares the columnar engine (one bulk read, cuts evaluated on numpy
+# arrays) to one TTree::Draw per step, for the yields of a cut flow, for an
+# increasing number of steps. Not run by the CI:
+#   usage benchcolumnar.py [entries] [steps...]
+
+import os
+import sys
+import time
+import array
+import shutil
+import tempfile
+import ROOT
+
+from ginger.tree import TreeWorker
+
+
+def maketree(path, n):
+    out = ROOT.TFile.Open(path,'recreate')
+    t = ROOT.TTree('bench','bench')
+
+    rnd = ROOT.TRandom3(1)
+    x = array.array('f',[0.])
+    y = array.array('f',[0.])
+    w = array.array('f',[0.])
+    t.Branch('x',x,'x/F')
+    t.Branch('y',y,'y/F')
+    t.Branch('w',w,'w/F')
+
+    for i in xrange(n):
+        x[0] = rnd.Uniform(0,100)
+        y[0] = rnd.Gaus(0,10)
+        w[0] = rnd.Uniform(0.5,1.5)
+        t.Fill()
+
+    t.Write()
+    out.Close()
+
+
+def benchcolumnar(worker, nsteps):
+    '''seconds taken by nsteps TTree::Draw and by the columnar engine, for the yields of a flow'''
+    cuts = [ 'x > %d && y < %d' % (100*i/max(nsteps,1),30-i) for i in xrange(nsteps) ]
+
+    start = time.time()
+    draws = [ worker.yields(' && '.join([ '(%s)' % c for c in cuts[:k+1] ])).value for k in xrange(nsteps) ]
+    tdraw = time.time()-start
+
+    start = time.time()
+    # no base: nothing is cached between the calls
+    masks = worker.columnar.cutmasks(cuts)
+    columnar = [ masks.yields(k).value for k in xrange(nsteps) ]
+    tcol = time.time()-start
+
+    for a,b in zip(draws,columnar):
+        assert abs(a-b) < 1e-6*max(1.,abs(a)), (a,b)
+
+    return tdraw,tcol
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    steps = [ int(a) for a in sys.argv[2:] ] or [1,2,5,10,20]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp,'bench.root')
+        maketree(path,n)
+        worker = TreeWorker('bench',[path])
+        worker.weight = 'w'
+
+        print '%d entries' % n
+        print '%6s %12s %12s %8s' % ('steps','Draw [s]','columnar [s]','ratio')
+        for k in steps:
+            tdraw,tcol = benchcolumnar(worker,k)
+            print '%6d %12.2f %12.2f %8.2f' % (k,tdraw,tcol,tcol/tdraw if tdraw else 0.)
+    finally:
+        shutil.rmtree(tmp)
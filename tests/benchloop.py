@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# Compares the python EventLoop to one TTree::Draw per step, for the yields
+# of a cut flow, for an increasing number of steps: the ratio tells from how
+# many passes the loop pays off. Not run by the CI:
+#   usage benchloop.py [entries] [steps...]
+
+import sys
+import time
+import array
+import ROOT
+
+from ginger import odict
+from ginger.loop import EventLoop, FlowYieldBooking
+
+
+def maketree(n):
+    t = ROOT.TTree('bench','bench')
+    t.SetDirectory(0x0)
+
+    rnd = ROOT.TRandom3(1)
+    x = array.array('f',[0.])
+    y = array.array('f',[0.])
+    w = array.array('f',[0.])
+    t.Branch('x',x,'x/F')
+    t.Branch('y',y,'y/F')
+    t.Branch('w',w,'w/F')
+
+    for i in xrange(n):
+        x[0] = rnd.Uniform(0,100)
+        y[0] = rnd.Gaus(0,10)
+        w[0] = rnd.Uniform(0.5,1.5)
+        t.Fill()
+
+    t.ResetBranchAddresses()
+    return t
+
+
+def benchloop(t, nsteps):
+    '''seconds taken by nsteps TTree::Draw and by one EventLoop, for the yields of a flow'''
+    cuts = [ 'x > %d' % (100*i/max(nsteps,1)) for i in xrange(nsteps) ]
+
+    start = time.time()
+    draws = []
+    for k in xrange(nsteps):
+        cut = ' && '.join([ '(%s)' % c for c in cuts[:k+1] ])
+        h = ROOT.TH1D('counter','counter',1,0.,1.)
+        t.Draw('0. >> counter','(w)*(%s)' % cut,'goff')
+        draws.append(h.GetBinContent(1))
+        h.Delete()
+    tdraw = time.time()-start
+
+    start = time.time()
+    bookings = odict.OrderedDict([('flow',FlowYieldBooking('w',cuts))])
+    EventLoop(t).run(bookings)
+    loop = [ y.value for y in bookings['flow'].result() ]
+    tloop = time.time()-start
+
+    for a,b in zip(draws,loop):
+        assert abs(a-b) < 1e-6*max(1.,abs(a)), (a,b)
+
+    return tdraw,tloop
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    steps = [ int(a) for a in sys.argv[2:] ] or [1,2,5,10,20]
+
+    t = maketree(n)
+    print '%d entries' % n
+    print '%6s %12s %12s %8s' % ('steps','Draw [s]','loop [s]','ratio')
+    for k in steps:
+        tdraw,tloop = benchloop(t,k)
+        print '%6d %12.2f %12.2f %8.2f' % (k,tdraw,tloop,tloop/tdraw if tdraw else 0.)
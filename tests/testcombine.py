@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import ROOT
+import array
+import os
+import shutil
+import tempfile
+
+from ginger.tree import TreeWorker
+
+
+def maketree(path):
+    out = ROOT.TFile.Open(path,'recreate')
+    t = ROOT.TTree('events','events')
+    x = array.array('f',[0.])
+    t.Branch('x',x,'x/F')
+    for i in xrange(100):
+        x[0] = i
+        t.Fill()
+    t.Write()
+    out.Close()
+
+
+def testcombine(path, compact):
+    w = TreeWorker('events',[path])
+    w.compact = compact
+
+    everything = w.spawnview()
+    low  = w.spawnview('x < 10')
+    high = w.spawnview('x >= 90')
+
+    # the unselected view is never listed entry by entry
+    assert (everything | low)._unselected()
+    assert (low | everything)._unselected()
+    assert (everything & low)._entryset() is low._entryset()
+    assert (everything & low)._elist is low._elist
+    assert (high & everything)._elist is high._elist
+
+    assert (everything | low).entries() == 100
+    assert (low & everything).entries() == 10
+    assert (high - everything).entries() == 0
+    assert (everything - high).entries() == 90
+    assert (low | high).entries() == 20
+    assert (low & high).entries() == 0
+
+def testlazy(path, compact):
+    w = TreeWorker('events',[path],selection='x >= 50',lazy=True)
+    w.compact = compact
+
+    # made before the chain, and the selection, exist
+    everything = w.spawnview()
+    assert not w.loaded
+
+    low = w.spawnview('x < 60')
+    assert low.entries() == 10
+
+    # the view holds the worker selection, not all the entries
+    assert not everything._unselected()
+    assert (everything - low).entries() == 40
+    assert (everything | low).entries() == 50
+
+if __name__ == '__main__':
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp,'combine.root')
+        maketree(path)
+        testcombine(path, False)
+        testcombine(path, True)
+        testlazy(path, False)
+        testlazy(path, True)
+    finally:
+        shutil.rmtree(tmp)
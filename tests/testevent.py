@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import ROOT
+import array
+import numpy as np
+
+from ginger.event import EventReader
+
+
+def maketree(n):
+    t = ROOT.TTree('events','events')
+    t.SetDirectory(0x0)
+
+    mll  = array.array('f',[0.])
+    njet = array.array('i',[0])
+    t.Branch('mll',mll,'mll/F')
+    t.Branch('njet',njet,'njet/I')
+
+    for i in xrange(n):
+        mll[0]  = i*0.5
+        njet[0] = i % 3
+        t.Fill()
+
+    t.ResetBranchAddresses()
+    return t
+
+
+def testevent():
+    t = maketree(1000)
+
+    reader = EventReader(t, ['mll','njet'])
+    print reader, reader.dtype
+
+    n = 0
+    for e in reader:
+        if e.njet == 0: n += 1
+    assert n == 334, n
+
+    blocks = list(reader.blocks(300))
+    print [len(b) for b in blocks]
+    assert [len(b) for b in blocks] == [300,300,300,100]
+    assert np.allclose(np.concatenate([b.mll for b in blocks]), np.arange(1000)*0.5)
+
+    # only the entries in the entrylist
+    t.Draw('>>elist','njet == 1','entrylist')
+    elist = ROOT.gDirectory.Get('elist')
+    t.SetEntryList(elist)
+    njets = set([ e.njet for e in reader ])
+    t.SetEntryList(0x0)
+    assert njets == set([1]), njets
+
+if __name__ == '__main__':
+    testevent()
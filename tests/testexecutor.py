@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import threading
+
+from ginger.executor import LoopExecutor
+from ginger import odict
+
+
+class FakeView(object):
+    '''counts the event loops'''
+    def __init__(self):
+        self.runs    = 0
+        self._booked = odict.OrderedDict()
+
+    def bookyields(self, name, value):
+        self._booked[name] = value
+
+    def run(self):
+        self.runs += 1
+        booked, self._booked = self._booked, odict.OrderedDict()
+        return booked
+
+
+def testexecutor():
+    v = FakeView()
+    ex = LoopExecutor()
+
+    finishers = []
+    def finish(r):
+        finishers.append(threading.current_thread())
+        return r*10
+
+    # the thread waits for the lock: the requests are queued together
+    with ex._lock:
+        futures = [ ex.submit(lambda: v, lambda view,n,i=i: view.bookyields(n,i), finish) for i in xrange(5) ]
+        failed = ex.submit(None, lambda: 1/0, None)
+
+    # processed in the background
+    ex.wait()
+    assert all([f.done() for f in futures])
+    # all queued together: one loop
+    assert v.runs == 1
+    assert not finishers
+
+    assert [f.result() for f in futures] == [0,10,20,30,40]
+    # finished on the calling thread
+    assert finishers == [threading.current_thread()]*5
+
+    assert isinstance(failed.exception(),ZeroDivisionError)
+
+if __name__ == '__main__':
+    testexecutor()
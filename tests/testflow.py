@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import ROOT
+import array
+import os
+import shutil
+import tempfile
+
+from ginger.tree import Sample
+from ginger.analysis import TreeAnalyser, CutFlow
+from ginger.odict import OrderedDict
+
+
+def maketree(path):
+    out = ROOT.TFile.Open(path,'recreate')
+    t = ROOT.TTree('events','events')
+    x = array.array('f',[0.])
+    t.Branch('x',x,'x/F')
+    for i in xrange(100):
+        x[0] = i
+        t.Fill()
+    t.Write()
+    out.Close()
+
+
+def testflow(path):
+    cuts = CutFlow([('a','x >= 10'),('b','x >= 20'),('c','x >= 50')])
+    expected = [90.,80.,50.]
+
+    a = TreeAnalyser([Sample('events',[path])], cuts)
+    a.onepass = True
+
+    # no views yet: the first step is made, the others filled in one loop
+    assert [ y.value for y in a.yieldsflow().itervalues() ] == expected
+
+    # all the views made: the looser steps must not take the deepest totals
+    a.bufferentries()
+    assert [ y.value for y in a.yieldsflow().itervalues() ] == expected
+
+    plots = a.plotsflow('hx','x',bins=(100,0.,100.))
+    assert [ h.GetEntries() for h in plots.itervalues() ] == expected
+
+def testvariations(path):
+    cuts = CutFlow([('a','x >= 10'),('b','x >= 20')])
+    variations = OrderedDict([('double','2'),('tight',(None,{'b':'x >= 50'}))])
+
+    a = TreeAnalyser([Sample('events',[path])], cuts)
+
+    # one TTree::Draw per variation or one loop, same yields
+    for onepass in (False, True):
+        a.onepass = onepass
+        yields = a.yieldsvariations(variations)
+        assert [ (n,y.value) for n,y in yields.iteritems() ] == [('nominal',80.),('double',160.),('tight',50.)]
+
+        plots = a.plotvariations('hx','x',variations,bins=(100,0.,100.))
+        assert [ h.Integral() for h in plots.itervalues() ] == [80.,160.,50.]
+
+if __name__ == '__main__':
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp,'flow.root')
+        maketree(path)
+        testflow(path)
+        testvariations(path)
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from ginger.formula import compileexpr
+
+def testformula():
+
+    columns = {
+        'Entry$'  : np.arange(4.),
+        'mll'     : np.array([5., 13., 20., 95.]),
+        'njet'    : np.array([0., 0., 1., 0.]),
+        'sameflav': np.array([1., 0., 0., 1.]),
+        'baseW'   : np.array([1., 2., 3., 4.]),
+        'jetpt[0]': np.array([10., 40., 50., 60.]),
+    }
+
+    aliases = {
+        'zveto': 'abs(mll-91.) > 15',
+        'jet30': 'jetpt[0] > 30',
+    }
+
+    checks = [
+        ('(baseW)*((mll > 12) && (njet == 0))', [0., 2., 0., 4.]),
+        ('!sameflav'                          , [0., 1., 1., 0.]),
+        ('zveto && jet30'                     , [0., 1., 1., 0.]),
+        ('TMath::Abs(mll-20)'                 , [15., 7., 0., 75.]),
+        ('(mll > 10)+(njet > 0)'              , [0., 1., 2., 1.]),
+        ('njet == 0 || !(mll < 15) && sameflav', [1., 1., 0., 1.]),
+        ('-mll^2/25'                          , [-1., -6.76, -16., -361.]),
+        ('1/2'                                , [0.5, 0.5, 0.5, 0.5]),
+    ]
+
+    for expr,expected in checks:
+        f = compileexpr(expr,aliases)
+        value = f(columns)
+        print '%-40s %-60s %s' % (expr,f.code,value)
+        assert np.allclose(value,expected), expr
+
+    f = compileexpr('zveto && jet30 && sameflav',aliases)
+    print f.columns,f.branches
+    assert f.branches == set(['mll','jetpt','sameflav'])
+
+    # compiled once
+    assert compileexpr('zveto && jet30 && sameflav',aliases) is f
+
+if __name__ == '__main__':
+    testformula()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import ROOT
+import array
+import os
+import shutil
+import tempfile
+
+from ginger.tree import TreeWorker
+
+
+def maketree(path):
+    out = ROOT.TFile.Open(path,'recreate')
+    t = ROOT.TTree('events','events')
+    x = array.array('f',[0.])
+    t.Branch('x',x,'x/F')
+    for i in xrange(100):
+        x[0] = i
+        t.Fill()
+    t.Write()
+    out.Close()
+
+
+def testscan(path):
+    w = TreeWorker('events',[path])
+
+    # one TTree::Draw
+    ranges = w.scan(['x','2*x'], 'x >= 10', keep=True)
+    assert (ranges['x'].min,ranges['x'].max,ranges['x'].n) == (10.,99.,90)
+    assert (ranges['2*x'].min,ranges['2*x'].max) == (20.,198.)
+    assert len(ranges['x'].values) == 90
+
+    assert w.getminmax('x',binsize=7) == (0.,105.)
+
+    # along with other bookings, in the event loop
+    w.bookyields('n', 'x >= 10')
+    w.bookscan('scan', ['x','2*x'], 'x >= 10')
+    results = w.run()
+    assert results['n'].value == 90.
+    assert [ (r.min,r.max) for r in results['scan'] ] == [(10.,99.),(20.,198.)]
+
+if __name__ == '__main__':
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp,'scan.root')
+        maketree(path)
+        testscan(path)
+    finally:
+        shutil.rmtree(tmp)
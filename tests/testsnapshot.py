@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import ROOT
+import array
+import os
+import shutil
+import tempfile
+
+from ginger.tree import TreeWorker, Sample
+from ginger.analysis import TreeAnalyser, CutFlow
+
+
+def maketree(path, name, branch, f):
+    out = ROOT.TFile.Open(path,'recreate')
+    t = ROOT.TTree(name,name)
+    v = array.array('f',[0.])
+    t.Branch(branch,v,branch+'/F')
+    for i in xrange(100):
+        v[0] = f(i)
+        t.Fill()
+    t.Write()
+    out.Close()
+
+
+def testsnapshot():
+    tmp = tempfile.mkdtemp()
+    try:
+        main   = os.path.join(tmp,'main.root')
+        friend = os.path.join(tmp,'friend.root')
+        snap   = os.path.join(tmp,'snap.root')
+        # the friend tree has the same name as the main one
+        maketree(main,'events','x',lambda i: i)
+        maketree(friend,'events','y',lambda i: 2*i)
+
+        t = TreeWorker('events',[main],friends=[('events',[friend])])
+        t.setalias('twox','2*x')
+        t.selection = 'x >= 50'
+        t.snapshot(snap)
+
+        s = Sample.fromsnapshot(snap)
+        print s
+        w = TreeWorker.fromsample(s)
+
+        assert w.entries() == 50, w.entries()
+        assert w.aliases().get('twox') == '2*x', w.aliases()
+
+        h = w.plot('hy','y',bins=(100,0.,200.))
+        assert h.GetEntries() == 50, h.GetEntries()
+        assert abs(h.GetMean()-149.) < 1e-3, h.GetMean()
+        # the friend entries follow the selected ones
+        assert w.entries('y != twox') == 0
+    finally:
+        shutil.rmtree(tmp)
+
+def testlumi():
+    tmp = tempfile.mkdtemp()
+    try:
+        main = os.path.join(tmp,'main.root')
+        maketree(main,'events','x',lambda i: i)
+
+        a = TreeAnalyser([Sample('events',[main],scale=2.)], CutFlow([('high','x >= 50')]))
+        a.lumi = 10.
+        samples = a.snapshot(os.path.join(tmp,'snap'))
+
+        # the lumi is not stored, neither in the samples nor in the files
+        s = Sample.fromsnapshot(samples[0].files[0])
+        assert samples[0].scale == s.scale == 2., (samples[0].scale,s.scale)
+
+        b = TreeAnalyser([s], CutFlow())
+        b.lumi = 10.
+        assert b.yields().value == a.yields().value == 1000., (b.yields(),a.yields())
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    testsnapshot()
+    testlumi()